@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as WaitTimeout
+import os
+import threading
+import time
+
+CACHE_MAX_SIZE = int(os.environ.get('AREA_CACHE_MAX_SIZE', 1024))
+CACHE_TTL = float(os.environ.get('AREA_CACHE_TTL', 3600))
+# seconds between the progress and cancellation checks of a call waiting for another one
+WAIT_INTERVAL = 0.05
+
+
+class ComputationCancelled(Exception):
+    """
+    Raised by a computation stopped on behalf of its own caller (a cancelled job, a closed stream).
+    Other callers waiting for the same value compute it themselves instead of failing.
+    """
+
+
+class Computation:
+    """
+    Value being computed for a key, with the latest progress published by the computing call.
+    """
+
+    def __init__(self):
+        self.future = Future()
+        self.progress = None
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with time-to-live. Identical requests arriving while the value is still
+    being computed wait for the first computation instead of starting their own.
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    def get_or_compute(self, key, compute, progress_callback=None, check_cancelled=None, store=True):
+        """
+        Returns (value, cached), where cached tells if the value was computed by another call.
+        Without store the value is only shared with the calls arriving while it is computed.
+        A call waiting for another one gets the progress published by it (see publish_progress)
+        through progress_callback and calls check_cancelled every WAIT_INTERVAL seconds; an
+        exception raised by either stops the wait, the computation goes on for the other calls.
+        When the computation waited for is cancelled, the waiting calls start over and one of them
+        computes the value.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return value, True
+                    del self._entries[key]
+                computation = self._in_flight.get(key)
+                if computation is None:
+                    computation = self._in_flight[key] = Computation()
+                    self.misses += 1
+                    break
+                self.deduplicated += 1
+
+            finished, value = self._wait(computation, progress_callback, check_cancelled)
+            if finished:
+                return value, True
+
+        try:
+            value = compute()
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[key]
+            computation.future.set_exception(error)
+            raise
+
+        with self._lock:
+            if store and self.max_size > 0:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            del self._in_flight[key]
+        computation.future.set_result(value)
+        return value, False
+
+    @staticmethod
+    def _wait(computation, progress_callback, check_cancelled):
+        """
+        Returns (True, value) once the computation is done, (False, None) when it was cancelled.
+        """
+        last_progress = None
+        while True:
+            try:
+                return True, computation.future.result(timeout=WAIT_INTERVAL)
+            except ComputationCancelled:
+                return False, None
+            except WaitTimeout:
+                pass
+            progress = computation.progress
+            if progress_callback is not None and progress is not None and progress is not last_progress:
+                last_progress = progress
+                progress_callback(progress)
+            if check_cancelled is not None:
+                check_cancelled()
+
+    def publish_progress(self, key, progress):
+        """
+        Called by the computation of key, the latest progress is passed on to the waiting calls.
+        """
+        with self._lock:
+            computation = self._in_flight.get(key)
+            if computation is not None:
+                computation.progress = progress
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'deduplicated': self.deduplicated,
+                    'in_flight': len(self._in_flight)}
@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+FIGURE_STORE_DIRECTORY = os.environ.get('FIGURE_STORE_DIRECTORY', os.path.join('figures', 'store'))
+FIGURE_STORE_MAX_BYTES = int(os.environ.get('FIGURE_STORE_MAX_BYTES', 256 * 2 ** 20))
+
+
+def get_figure_key(*parts):
+    """
+    Hash of the geometry and render options, parts must have a stable repr (tuples of numbers
+    and strings, like the canonical keys of the figures).
+    """
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+class FigureStore:
+    """
+    Rendered PNGs stored under the hash of everything that changes the image, so a figure is
+    rendered once and repeated requests are served from disk. When the files take more than
+    max_bytes the least recently used ones are removed. Every hit sets the access time of the file,
+    so files left by a previous run are picked up in the order they were used.
+    """
+
+    def __init__(self, directory=FIGURE_STORE_DIRECTORY, max_bytes=FIGURE_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._sizes = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        # the directory is resolved and scanned on first use, like the other paths relative to the working directory
+        if self._sizes is not None:
+            return
+        self.directory = os.path.abspath(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._sizes = OrderedDict()
+        files = [entry for entry in os.scandir(self.directory)
+                 if entry.name.endswith('.png') and not entry.name.startswith('.')]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_atime):
+            self._sizes[entry.name[:-len('.png')]] = entry.stat().st_size
+            self._total_bytes += entry.stat().st_size
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def __contains__(self, key):
+        with self._lock:
+            self._load()
+            return key in self._sizes
+
+    def get(self, key):
+        """
+        Path of the stored figure, marked as recently used, or None.
+        """
+        with self._lock:
+            self._load()
+            if key not in self._sizes:
+                return None
+            self._sizes.move_to_end(key)
+        path = self.get_path(key)
+        try:
+            # only the access time, the modification time is the Last-Modified of the figure
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            self.delete(key)
+            return None
+        return path
+
+    def get_or_render(self, key, render):
+        """
+        Returns (path, rendered). On a miss render(path) writes the PNG to the given temporary path,
+        which is then moved into the store.
+        """
+        path = self.get(key)
+        if path is not None:
+            with self._lock:
+                self.hits += 1
+            return path, False
+
+        temporary_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.png")
+        try:
+            render(temporary_path)
+            os.replace(temporary_path, self.get_path(key))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        size = os.path.getsize(self.get_path(key))
+        with self._lock:
+            self.misses += 1
+            self._total_bytes += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            self._evict()
+        return self.get_path(key), True
+
+    def read(self, key, render=None):
+        """
+        Returns (content, stat) of the stored figure, rendered on a miss when render is given and None
+        otherwise. The file is read through one open handle, so content and stat belong together even
+        when the figure is evicted or deleted meanwhile; a file removed before it was opened is looked
+        up again.
+        """
+        while True:
+            if render is None:
+                path = self.get(key)
+                if path is None:
+                    return None
+            else:
+                path, _ = self.get_or_render(key, render)
+            try:
+                with open(path, 'rb') as file:
+                    return file.read(), os.fstat(file.fileno())
+            except FileNotFoundError:
+                continue
+
+    def _evict(self):
+        # the newest figure is kept even if it alone is over the limit
+        while self._total_bytes > self.max_bytes and len(self._sizes) > 1:
+            key, size = self._sizes.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
+
+    def delete(self, key):
+        with self._lock:
+            self._load()
+            size = self._sizes.pop(key, None)
+            if size is None:
+                return False
+            self._total_bytes -= size
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            self._load()
+            return {'files': len(self._sizes), 'bytes': self._total_bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def get_validators(file, key=None):
+    """
+    ETag and Last-Modified headers of a file, given by its path or its os.stat_result. The ETag is
+    the store key when given.
+    """
+    stat = file if isinstance(file, os.stat_result) else os.stat(file)
+    etag = key or hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()
+    return {'ETag': f'"{etag}"', 'Last-Modified': formatdate(stat.st_mtime, usegmt=True)}
+
+
+def is_not_modified(request_headers, validators):
+    """
+    Conditional GET: If-None-Match takes precedence over If-Modified-Since, as in RFC 7232.
+    """
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or validators['ETag'] in tags
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            return parsedate_to_datetime(validators['Last-Modified']) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
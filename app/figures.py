@@ -1,18 +1,42 @@
-import matplotlib.pyplot as plt
+import math
 import numpy as np
+from app.indexes import (ConvexIndex, EdgesCross, SlabIndex, as_coordinate_arrays, crossing_number_contains,
+                         get_grid_index, is_convex)
 
 PI = np.pi
 atol = 1e-12
+# below this number of samples building or looking up the grid index does not pay off
+GRID_INDEX_MIN_POINTS = 4096
+# above this number of vertices building the grid index costs more than searching the wedges of a convex polygon
+CONVEX_INDEX_MIN_VERTICES = 256
+# larger slab indexes of concave polygons are not built, the grid index is used instead
+SLAB_INDEX_MAX_ENTRIES = 2 ** 22
 
 
 class Point:
+    """
+    r and phi are computed on first use, most points only ever need x and y.
+    """
+    __slots__ = ('name', 'x', 'y', '_r', '_phi')
 
     def __init__(self, name, x, y):
         self.name = name
         self.x = x
         self.y = y
-        self.r = np.sqrt(x ** 2 + y ** 2)
-        self.phi = round(np.arcsin(y / self.r) * 360 / (2 * PI), 2) if self.r > 0 else 0
+        self._r = None
+        self._phi = None
+
+    @property
+    def r(self):
+        if self._r is None:
+            self._r = np.sqrt(self.x ** 2 + self.y ** 2)
+        return self._r
+
+    @property
+    def phi(self):
+        if self._phi is None:
+            self._phi = round(np.arcsin(self.y / self.r) * 360 / (2 * PI), 2) if self.r > 0 else 0
+        return self._phi
 
     def get_distance(self, p):
         return np.sqrt((self.x - p.x) ** 2 + (self.y - p.y) ** 2)
@@ -38,10 +62,85 @@ class Point:
             return f"({self.x}, {self.y})"
 
 
+class PointSet:
+    """
+    Many points stored as contiguous arrays of x and y, with the geometry of Point vectorized over
+    them. Indexing with an integer gives a Point, slices and index arrays give a PointSet. The
+    methods of Point also accept a PointSet as the other point and return arrays.
+    """
+    __slots__ = ('x', 'y', 'names')
+
+    def __init__(self, x, y, names=None):
+        self.x = np.ascontiguousarray(x, dtype=float)
+        self.y = np.ascontiguousarray(y, dtype=float)
+        if self.x.ndim != 1 or self.x.shape != self.y.shape:
+            raise ValueError("x and y must be 1-D arrays of the same length")
+        self.names = list(names) if names is not None else [''] * len(self.x)
+
+    @classmethod
+    def from_points(cls, points):
+        # anything with name, x and y: Points or the request models
+        return cls([p.x for p in points], [p.y for p in points], [p.name for p in points])
+
+    @classmethod
+    def from_dicts(cls, points):
+        return cls([p['x'] for p in points], [p['y'] for p in points], [p['name'] for p in points])
+
+    @property
+    def r(self):
+        return np.sqrt(self.x ** 2 + self.y ** 2)
+
+    @property
+    def phi(self):
+        r = self.r
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = np.round(np.arcsin(self.y / r) * 360 / (2 * PI), 2)
+        return np.where(r > 0, phi, 0.0)
+
+    def get_distance(self, p):
+        return np.sqrt((self.x - p.x) ** 2 + (self.y - p.y) ** 2)
+
+    def get_relative_angle(self, p):
+        relative_x = p.x - self.x
+        relative_y = p.y - self.y
+        return np.angle(relative_x + 1j * relative_y, deg=True)
+
+    def isclose(self, p):
+        """
+        Equality of Point with tolerance, for every point of the set.
+        """
+        return np.isclose(self.x, p.x, atol=atol) & np.isclose(self.y, p.y, atol=atol)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Point(self.names[index], float(self.x[index]), float(self.y[index]))
+        indices = np.arange(len(self.x))[index]
+        return PointSet(self.x[indices], self.y[indices], [self.names[i] for i in indices])
+
+    def __iter__(self):
+        return (Point(name, x, y) for name, x, y in zip(self.names, self.x.tolist(), self.y.tolist()))
+
+    def __contains__(self, p):
+        return bool(self.isclose(p).any())
+
+    def __eq__(self, other):
+        # like lists of Points: same length and every pair equal with tolerance, names are ignored
+        if not isinstance(other, PointSet):
+            return NotImplemented
+        return len(self) == len(other) and bool(self.isclose(other).all())
+
+    def __repr__(self):
+        return ", ".join(str(p) for p in self)
+
+
 class Line:
 
     def __init__(self, slope, intercept, starting_point=None, ending_point=None):
-        self.name = "line_" + starting_point.name + ending_point.name if (starting_point and ending_point) else "line"
+        self.name = (f"line_{starting_point.name or ''}{ending_point.name or ''}"
+                     if (starting_point and ending_point) else "line")
         self.slope = slope
         self.intercept = intercept
         self.starting_point = starting_point
@@ -128,12 +227,33 @@ class Figure:
     def is_point_inside(self, p):
         raise NotImplementedError("Subclasses should implement this!")
 
+    def contains(self, xs, ys):
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+        inside = [self.is_point_inside(Point('', x, y)) for x, y in zip(xs.ravel(), ys.ravel())]
+        return np.array(inside, dtype=bool).reshape(xs.shape)
+
+    def contains_points(self, points):
+        # points is an (n, 2) array or a PointSet, figures of other dimensions override this
+        if isinstance(points, PointSet):
+            return self.contains(points.x, points.y)
+        return self.contains(points[:, 0], points[:, 1])
+
     def draw(self):
         raise NotImplementedError("Subclasses should implement this!")
 
     def get_area(self):
         raise NotImplementedError("Subclasses should implement this!")
 
+    def get_bounding_box(self):
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def get_translated(self, offsets):
+        # the same figure moved by offsets, one per axis
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def get_canonical_key(self, decimals=9):
+        raise NotImplementedError("Subclasses should implement this!")
+
 
 class Circle(Figure):
 
@@ -142,16 +262,33 @@ class Circle(Figure):
         self.radius = radius
 
     def is_point_inside(self, p):
+        if isinstance(p, PointSet):
+            return self.contains(p.x, p.y)
         if ((p.x - self.center.x) ** 2 + (p.y - self.center.y) ** 2) < self.radius ** 2:
             return True
         return False
 
+    def contains(self, xs, ys):
+        xs, ys = as_coordinate_arrays(xs, ys)
+        return (xs - self.center.x) ** 2 + (ys - self.center.y) ** 2 < self.radius ** 2
+
     def get_circumference(self):
         return 2 * PI * self.radius
 
     def get_area(self):
         return PI * self.radius ** 2
 
+    def get_bounding_box(self):
+        return (self.center.x - self.radius, self.center.x + self.radius,
+                self.center.y - self.radius, self.center.y + self.radius)
+
+    def get_translated(self, offsets):
+        dx, dy = offsets
+        return Circle(Point(self.center.name, self.center.x + float(dx), self.center.y + float(dy)), self.radius)
+
+    def get_canonical_key(self, decimals=9):
+        return 'circle', round(self.center.x, decimals), round(self.center.y, decimals), round(self.radius, decimals)
+
     def draw(self, fig, ax, **kwargs):
         phi = np.linspace(0, 2 * PI, 1000)
         x = np.sin(phi) * self.radius + self.center.x
@@ -163,37 +300,119 @@ class Circle(Figure):
         return f"circle ({self.center}, {self.radius})"
 
 
+class Ball(Figure):
+    """
+    Ball of any dimension, given by the coordinates of its center. Its volume is reported as the
+    area, like the area of a Circle, which is the 2-D ball.
+    """
+
+    def __init__(self, center, radius):
+        self.center = np.asarray(center, dtype=float)
+        self.radius = float(radius)
+        self.dimension = len(self.center)
+
+    def contains_points(self, points):
+        """
+        points is an (n, dimension) array, the squared distances to the center are summed in one
+        einsum reduction. Balls centered at the origin skip the array of offsets.
+        """
+        offsets = points - self.center.astype(points.dtype) if self.center.any() else points
+        return np.einsum('ij,ij->i', offsets, offsets) < self.radius ** 2
+
+    def contains(self, *coordinates):
+        return self.contains_points(np.column_stack(coordinates))
+
+    def get_volume(self):
+        # pi^(d/2) / Gamma(d/2 + 1) * r^d, through logarithms so large dimensions do not overflow
+        d = self.dimension
+        return math.exp(d / 2 * math.log(PI) - math.lgamma(d / 2 + 1) + d * math.log(self.radius))
+
+    def get_area(self):
+        return self.get_volume()
+
+    def get_bounding_box(self):
+        """
+        Low and high border of every axis, in 2-D (left, right, bottom, top) as for the other figures.
+        """
+        return tuple(float(border) for coordinate in self.center
+                     for border in (coordinate - self.radius, coordinate + self.radius))
+
+    def get_translated(self, offsets):
+        return Ball(self.center + np.asarray(offsets, dtype=float), self.radius)
+
+    def get_canonical_key(self, decimals=9):
+        return 'ball', tuple(np.round(self.center, decimals).tolist()), round(self.radius, decimals)
+
+    def draw(self, fig, ax, **kwargs):
+        # only 2-D balls can be drawn, as the circle they are
+        Circle(Point('O', *self.center.tolist()), self.radius).draw(fig, ax, **kwargs)
+
+    def __repr__(self):
+        return f"ball ({self.center.tolist()}, {self.radius})"
+
+
 class Polygon(Figure):
 
-    def __init__(self, vertices):
+    def __init__(self, vertices, keep_order=False):
         if len(vertices) < 3:
             return None
         self.number_of_vertices = len(vertices)
-        self.vertices, self.edges = self.create_vertices_and_edges(vertices)
-        self.left_border = min([p.x for p in self.vertices])
-        self.right_border = max([p.x for p in self.vertices])
-        self.bottom_border = min([p.y for p in self.vertices])
-        self.top_border = max([p.y for p in self.vertices])
-
-    def create_vertices_and_edges(self, vertices):
-        first_verticle = min(vertices, key=lambda p: p.r)
-        vertices_sorted = sorted(vertices, key=lambda v: first_verticle.get_relative_angle(v))
-        vertices_sorted.remove(first_verticle)
-        vertices_sorted = [first_verticle] + vertices_sorted + [first_verticle]
-        edges = [Line.create_line_from_points(vertices_sorted[i], vertices_sorted[i + 1])
-                 for i in range(self.number_of_vertices)]
-        return vertices_sorted[:-1], edges
+        self.vertices = self.create_vertices(vertices, keep_order)
+        self.vertices_x = self.vertices.x
+        self.vertices_y = self.vertices.y
+        self.left_border = float(self.vertices_x.min())
+        self.right_border = float(self.vertices_x.max())
+        self.bottom_border = float(self.vertices_y.min())
+        self.top_border = float(self.vertices_y.max())
+        self._edges = None
+        self.convex_index = None
+        self.convex_index_checked = False
+        self.slab_index = None
+        self.slab_index_checked = False
+        self.simple = None
+
+    def create_vertices(self, vertices, keep_order=False):
+        """
+        vertices is a list of Points or a PointSet, the result is a PointSet. Vertices are sorted by
+        angle around the vertex closest to the origin, which gives a simple polygon for points in
+        any order. With keep_order they are taken as given, in boundary order, so concave polygons
+        that are not star-shaped around that vertex keep their shape.
+        """
+        if not isinstance(vertices, PointSet):
+            vertices = PointSet.from_points(vertices)
+        if keep_order:
+            return vertices
+        first_verticle = int(np.argmin(vertices.r))
+        angles = vertices[first_verticle].get_relative_angle(vertices)
+        others = np.delete(np.arange(len(vertices)), first_verticle)
+        return vertices[np.concatenate(([first_verticle], others[np.argsort(angles[others], kind='stable')]))]
+
+    @property
+    def edges(self):
+        """
+        Lines between consecutive vertices, created on first use, the vectorized containment tests
+        only need the vertex arrays.
+        """
+        if self._edges is None:
+            vertices = list(self.vertices)
+            self._edges = [Line.create_line_from_points(p, q) for p, q in zip(vertices, vertices[1:] + vertices[:1])]
+        return self._edges
 
     def is_convex(self):
-        for i in range(self.number_of_vertices):
-            relative_angles = np.array([self.vertices[i].get_relative_angle(self.vertices[j])
-                                        for j in range(i + 1, self.number_of_vertices)])
-            if np.any(relative_angles[1:] - relative_angles[:-1] < 0):
-                return False
-        return True
+        return is_convex(self.vertices_x, self.vertices_y)
+
+    def is_simple(self):
+        """
+        False when edges of the polygon cross, found while building the slab index. None when the
+        index would be too large to build.
+        """
+        self.get_slab_index()
+        return self.simple
 
 
     def is_point_inside(self, p):
+        if isinstance(p, PointSet):
+            return self.contains(p.x, p.y)
 
         if self.left_border < p.x < self.right_border and self.bottom_border < p.y < self.top_border:
             for vertex in self.vertices:
@@ -208,6 +427,74 @@ class Polygon(Figure):
         else:
             return False
 
+    def contains(self, xs, ys):
+        """
+        Polygons with more than CONVEX_INDEX_MIN_VERTICES vertices are searched in O(log V) per
+        sample, by wedges when convex and by slabs otherwise. Other large batches of samples go
+        through the grid index.
+        """
+        xs, ys = as_coordinate_arrays(xs, ys)
+        has_area = self.right_border > self.left_border and self.top_border > self.bottom_border
+        if self.number_of_vertices > CONVEX_INDEX_MIN_VERTICES and has_area:
+            index = self.get_convex_index() or self.get_slab_index()
+            if index is not None:
+                return index.contains(xs, ys)
+        if xs.size >= GRID_INDEX_MIN_POINTS and has_area:
+            return self.get_grid_index().contains(xs, ys)
+        return crossing_number_contains(self.vertices_x, self.vertices_y, xs, ys)
+
+    def get_convex_index(self):
+        """
+        Built on first use and kept with the polygon, None when the polygon is not convex.
+        """
+        if not self.convex_index_checked:
+            self.convex_index = ConvexIndex(self.vertices_x, self.vertices_y) if self.is_convex() else None
+            self.convex_index_checked = True
+        return self.convex_index
+
+    def get_slab_index(self):
+        """
+        Built on first use and kept with the polygon, None when it would have more than
+        SLAB_INDEX_MAX_ENTRIES entries or the edges cross, then samples go through the grid index
+        which counts crossings.
+        """
+        if not self.slab_index_checked:
+            try:
+                self.slab_index = SlabIndex(self.vertices_x, self.vertices_y, SLAB_INDEX_MAX_ENTRIES)
+                self.simple = True
+            except EdgesCross:
+                self.slab_index = None
+                self.simple = False
+            except ValueError:
+                self.slab_index = None
+            self.slab_index_checked = True
+        return self.slab_index
+
+    def get_grid_index(self):
+        return get_grid_index(tuple(zip(self.vertices_x.tolist(), self.vertices_y.tolist())))
+
+    def get_translated(self, offsets):
+        # the vertices are already in boundary order, the indexes are built again on first use
+        dx, dy = offsets
+        vertices = PointSet(self.vertices_x + dx, self.vertices_y + dy, self.vertices.names)
+        return Polygon(vertices, keep_order=True)
+
+    def get_area(self):
+        x, y = self.vertices_x, self.vertices_y
+        return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+
+    def get_bounding_box(self):
+        return self.left_border, self.right_border, self.bottom_border, self.top_border
+
+    def get_canonical_key(self, decimals=9):
+        """
+        Vertices in the order set by create_vertices, without names and rounded,
+        so the same polygon uploaded with other names or vertex order gives the same key
+        (with keep_order only the same boundary order does).
+        """
+        return 'polygon', tuple(zip(np.round(self.vertices_x, decimals).tolist(),
+                                    np.round(self.vertices_y, decimals).tolist()))
+
     def get_perimeter(self):
         return round(sum(edge.get_length() for edge in self.edges), 2)
 
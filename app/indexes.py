@@ -0,0 +1,264 @@
+from functools import lru_cache
+import numpy as np
+
+OUTSIDE = 0
+INSIDE = 1
+BOUNDARY = 2
+DEFAULT_GRID_RESOLUTION = 256
+
+
+def as_coordinate_arrays(xs, ys):
+    """
+    Broadcasts the coordinates of the samples. float32 samples stay in single precision, anything
+    else is converted to float64.
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    dtype = np.float32 if xs.dtype == ys.dtype == np.float32 else np.float64
+    return np.broadcast_arrays(xs.astype(dtype, copy=False), ys.astype(dtype, copy=False))
+
+
+def crossing_number_contains(vertices_x, vertices_y, xs, ys):
+    """
+    Vectorized crossing-number test: a sample is inside when a ray cast from it
+    in the +x direction crosses the boundary an odd number of times. The test runs in the
+    precision of the samples.
+    """
+    xs, ys = as_coordinate_arrays(xs, ys)
+    inside = np.zeros(xs.shape, dtype=bool)
+    vertices_x, vertices_y = np.asarray(vertices_x, dtype=xs.dtype), np.asarray(vertices_y, dtype=xs.dtype)
+    x_end, y_end = np.roll(vertices_x, -1), np.roll(vertices_y, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for x1, y1, x2, y2 in zip(vertices_x, vertices_y, x_end, y_end):
+            crosses = (y1 > ys) != (y2 > ys)
+            x_crossing = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (xs < x_crossing)
+    return inside
+
+
+class GridIndex:
+    """
+    Uniform grid over the bounding box of a polygon. Every cell is classified once as inside,
+    outside or boundary (crossed by an edge). A sample is then resolved by a cell lookup and only
+    samples in boundary cells go through the exact crossing-number test.
+    """
+
+    def __init__(self, vertices_x, vertices_y, resolution=DEFAULT_GRID_RESOLUTION):
+        self.vertices_x = np.asarray(vertices_x, dtype=float)
+        self.vertices_y = np.asarray(vertices_y, dtype=float)
+        self.resolution = resolution
+        self.left, self.right = self.vertices_x.min(), self.vertices_x.max()
+        self.bottom, self.top = self.vertices_y.min(), self.vertices_y.max()
+        self.cell_width = (self.right - self.left) / resolution
+        self.cell_height = (self.top - self.bottom) / resolution
+        self.cells = self.classify_cells()
+
+    def classify_cells(self):
+        n = self.resolution
+        cells = np.zeros((n, n), dtype=np.int8)
+        centers_x = self.left + (np.arange(n) + 0.5) * self.cell_width
+        centers_y = self.bottom + (np.arange(n) + 0.5) * self.cell_height
+        grid_x, grid_y = np.meshgrid(centers_x, centers_y)
+        cells[crossing_number_contains(self.vertices_x, self.vertices_y, grid_x, grid_y)] = INSIDE
+
+        x_end, y_end = np.roll(self.vertices_x, -1), np.roll(self.vertices_y, -1)
+        for x1, y1, x2, y2 in zip(self.vertices_x, self.vertices_y, x_end, y_end):
+            cells[self.get_cells_crossed_by_edge(x1, y1, x2, y2)] = BOUNDARY
+        return cells
+
+    def get_cells_crossed_by_edge(self, x1, y1, x2, y2):
+        """
+        Cells overlapping the bounding box of the edge whose corners are not all strictly on one
+        side of the line through the edge. Cells touched by the edge are counted as crossed.
+        """
+        n = self.resolution
+        column_min, column_max = self.get_cell_range(min(x1, x2), max(x1, x2), self.left, self.cell_width)
+        row_min, row_max = self.get_cell_range(min(y1, y2), max(y1, y2), self.bottom, self.cell_height)
+        columns, rows = np.meshgrid(np.arange(column_min, column_max + 1), np.arange(row_min, row_max + 1))
+        cell_left = self.left + columns * self.cell_width
+        cell_bottom = self.bottom + rows * self.cell_height
+        sides = [(x2 - x1) * (corner_y - y1) - (y2 - y1) * (corner_x - x1)
+                 for corner_x in (cell_left, cell_left + self.cell_width)
+                 for corner_y in (cell_bottom, cell_bottom + self.cell_height)]
+        crossed = ~(np.all([side > 0 for side in sides], axis=0) | np.all([side < 0 for side in sides], axis=0))
+        crossed_cells = np.zeros((n, n), dtype=bool)
+        crossed_cells[rows[crossed], columns[crossed]] = True
+        return crossed_cells
+
+    def get_cell_range(self, low, high, origin, cell_size):
+        # one extra cell on each side absorbs rounding at cell borders
+        first = int(np.floor((low - origin) / cell_size)) - 1 if cell_size > 0 else 0
+        last = int(np.floor((high - origin) / cell_size)) + 1 if cell_size > 0 else 0
+        return max(first, 0), min(last, self.resolution - 1)
+
+    def contains(self, xs, ys):
+        xs, ys = as_coordinate_arrays(xs, ys)
+        in_box = (self.left <= xs) & (xs <= self.right) & (self.bottom <= ys) & (ys <= self.top)
+        columns = np.clip(((xs - self.left) / self.cell_width).astype(np.int64), 0, self.resolution - 1)
+        rows = np.clip(((ys - self.bottom) / self.cell_height).astype(np.int64), 0, self.resolution - 1)
+        states = np.where(in_box, self.cells[rows, columns], OUTSIDE)
+        inside = states == INSIDE
+        boundary = states == BOUNDARY
+        inside[boundary] = crossing_number_contains(self.vertices_x, self.vertices_y, xs[boundary], ys[boundary])
+        return inside
+
+
+class ConvexIndex:
+    """
+    Containment in a convex polygon in O(log V) per sample. The rays from the first vertex (the
+    pivot) to all other vertices split the polygon into triangular wedges ordered by angle. A
+    sample is located in its wedge by a binary search over the ray angles and is inside when it is
+    on the inner side of the wedge's polygon edge.
+    """
+
+    def __init__(self, vertices_x, vertices_y):
+        vertices_x = np.asarray(vertices_x, dtype=float)
+        vertices_y = np.asarray(vertices_y, dtype=float)
+        signed_area = np.dot(vertices_x, np.roll(vertices_y, -1)) - np.dot(vertices_y, np.roll(vertices_x, -1))
+        if signed_area < 0:
+            # counterclockwise order with the same pivot
+            vertices_x = np.r_[vertices_x[0], vertices_x[:0:-1]]
+            vertices_y = np.r_[vertices_y[0], vertices_y[:0:-1]]
+        self.vertices_x, self.vertices_y = vertices_x, vertices_y
+        self.pivot_x, self.pivot_y = vertices_x[0], vertices_y[0]
+        self.reference_x = vertices_x[1] - self.pivot_x
+        self.reference_y = vertices_y[1] - self.pivot_y
+        # angles of the rays measured from the ray to the second vertex, rising from 0 to below pi
+        self.angles = self.get_angles(vertices_x[1:], vertices_y[1:])
+
+    def get_angles(self, xs, ys):
+        dx, dy = xs - self.pivot_x, ys - self.pivot_y
+        return np.arctan2(self.reference_x * dy - self.reference_y * dx, self.reference_x * dx + self.reference_y * dy)
+
+    def contains(self, xs, ys):
+        xs, ys = as_coordinate_arrays(xs, ys)
+        angles = self.get_angles(xs, ys)
+        # wedge k lies between the rays to vertices k + 1 and k + 2
+        wedges = np.clip(np.searchsorted(self.angles, angles, side='right') - 1, 0, len(self.angles) - 2)
+        start_x, start_y = self.vertices_x[wedges + 1], self.vertices_y[wedges + 1]
+        end_x, end_y = self.vertices_x[wedges + 2], self.vertices_y[wedges + 2]
+        inner_side = (end_x - start_x) * (ys - start_y) - (end_y - start_y) * (xs - start_x) >= 0
+        return (angles >= 0) & (angles <= self.angles[-1]) & inner_side
+
+
+class EdgesCross(ValueError):
+    pass
+
+
+class SlabIndex:
+    """
+    Slab decomposition of a simple polygon. Vertical lines through the vertices split its bounding
+    box into slabs. No vertex lies inside a slab, so the edges crossing a slab do not intersect there
+    and are ordered by y. A sample is located in its slab by a binary search over the slab borders,
+    then a second binary search over the edges of the slab counts the edges below it. The sample is
+    inside when that count is odd.
+    The edges of all slabs are stored in one array, slab i owns entries starts[i]:starts[i + 1]. A
+    vertical line can cross O(V) edges, so the number of entries is bounded by max_entries.
+    Polygons whose edges cross (vertices given in an order that makes the outline intersect itself)
+    raise EdgesCross: two edges cross inside a slab when their order differs at its two borders, and
+    on a border when they pass it in a different order.
+    """
+
+    def __init__(self, vertices_x, vertices_y, max_entries=None):
+        x1, y1 = np.asarray(vertices_x, dtype=float), np.asarray(vertices_y, dtype=float)
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        self.borders = np.unique(x1)
+        first_slabs = np.searchsorted(self.borders, np.minimum(x1, x2))
+        # number of slabs crossed by every edge, 0 for vertical edges
+        spans = np.searchsorted(self.borders, np.maximum(x1, x2)) - first_slabs
+        number_of_entries = int(spans.sum())
+        if max_entries is not None and number_of_entries > max_entries:
+            raise ValueError(f"Slab index would have {number_of_entries} entries, more than {max_entries}")
+
+        edges = np.repeat(np.arange(len(x1)), spans)
+        first_entries = np.cumsum(spans) - spans
+        slabs = np.repeat(first_slabs - first_entries, spans) + np.arange(number_of_entries)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.where(spans > 0, (y2 - y1) / (x2 - x1), 0.0)
+        middles = (self.borders[slabs] + self.borders[slabs + 1]) / 2
+        order = np.lexsort((y1[edges] + (middles - x1[edges]) * slopes[edges], slabs))
+        edges, slabs = edges[order], slabs[order]
+        self.x1, self.y1, self.slopes = x1[edges], y1[edges], slopes[edges]
+        counts = np.bincount(slabs, minlength=max(len(self.borders) - 1, 0))
+        self.starts = np.r_[0, np.cumsum(counts)]
+        self.check_edges_do_not_cross(edges, slabs, np.minimum(x1, x2), np.where(x1 <= x2, y1, y2), slopes)
+        self.depth = int(counts.max()).bit_length() if counts.size else 0
+
+    def check_edges_do_not_cross(self, edges, slabs, left_x, left_y, slopes):
+        """
+        Raises EdgesCross. y is computed from the left end of every edge (left_x, left_y), so edges
+        leaving the same vertex get the same y at its border. The rounding error of y grows with the
+        slope, so does the tolerance. Collinear edges that overlap do not cross.
+        """
+        tolerances = 1e-9 * max(np.abs(left_x).max(), np.abs(left_y).max(), 1.0) * (1 + np.abs(slopes))
+
+        def get_y(entries, borders):
+            edge = edges[entries]
+            return left_y[edge] + (borders - left_x[edge]) * slopes[edge]
+
+        # consecutive entries of a slab, ordered by y in its middle, must not swap at its borders
+        entries = np.arange(len(edges))
+        lefts, rights = get_y(entries, self.borders[slabs]), get_y(entries, self.borders[slabs + 1])
+        tolerance = tolerances[edges[:-1]] + tolerances[edges[1:]]
+        swapped = (slabs[1:] == slabs[:-1]) & ((lefts[:-1] - lefts[1:] > tolerance) |
+                                               (rights[:-1] - rights[1:] > tolerance))
+        if swapped.any():
+            i = int(np.argmax(swapped))
+            raise EdgesCross(f"Edges {edges[i]} and {edges[i + 1]} cross between x = {self.borders[slabs[i]]} "
+                             f"and x = {self.borders[slabs[i] + 1]}")
+
+        # edges passing a border must be in the same order at the outer borders of the two slabs
+        by_edge = np.lexsort((slabs, edges))
+        passing = by_edge[:-1][edges[by_edge[1:]] == edges[by_edge[:-1]]]
+        passed = slabs[passing]
+        lefts, rights = get_y(passing, self.borders[passed]), get_y(passing, self.borders[passed + 2])
+        order = np.lexsort((rights, lefts, passed))
+        passed, rights, passing = passed[order], rights[order], passing[order]
+        tolerance = tolerances[edges[passing[:-1]]] + tolerances[edges[passing[1:]]]
+        swapped = (passed[1:] == passed[:-1]) & (rights[:-1] - rights[1:] > tolerance)
+        if swapped.any():
+            raise EdgesCross(f"Edges of the polygon cross at x = {self.borders[passed[int(np.argmax(swapped))] + 1]}")
+
+    def contains(self, xs, ys):
+        xs, ys = as_coordinate_arrays(xs, ys)
+        inside = np.zeros(xs.shape, dtype=bool)
+        slabs = np.searchsorted(self.borders, xs, side='right') - 1
+        in_slab = (slabs >= 0) & (slabs < len(self.borders) - 1)
+        xs, ys, slabs = xs[in_slab], ys[in_slab], slabs[in_slab]
+        low, high = self.starts[slabs], self.starts[slabs + 1]
+        first = low
+        last_entry = max(len(self.x1) - 1, 0)
+        for _ in range(self.depth):
+            middle = (low + high) // 2
+            entry = np.minimum(middle, last_entry)
+            below = self.y1[entry] + (xs - self.x1[entry]) * self.slopes[entry] <= ys
+            searching = low < high
+            low = np.where(searching & below, middle + 1, low)
+            high = np.where(searching & ~below, middle, high)
+        inside[in_slab] = (low - first) % 2 == 1
+        return inside
+
+
+def is_convex(vertices_x, vertices_y):
+    """
+    A polygon given by its vertices in boundary order is convex when all turns between consecutive
+    edges go the same way and add up to one full turn (a star polygon turns more than once).
+    Collinear vertices are allowed.
+    """
+    edges_x = np.roll(vertices_x, -1) - vertices_x
+    edges_y = np.roll(vertices_y, -1) - vertices_y
+    turns = edges_x * np.roll(edges_y, -1) - edges_y * np.roll(edges_x, -1)
+    tolerance = 1e-12 * max(np.abs(turns).max(), 1e-300)
+    if not (np.all(turns >= -tolerance) or np.all(turns <= tolerance)):
+        return False
+    turning = np.arctan2(turns, edges_x * np.roll(edges_x, -1) + edges_y * np.roll(edges_y, -1)).sum()
+    return bool(abs(abs(turning) - 2 * np.pi) < 1e-6)
+
+
+@lru_cache(maxsize=256)
+def get_grid_index(vertices, resolution=DEFAULT_GRID_RESOLUTION):
+    """
+    Grid indexes are cached on the vertex coordinates, so requests for the same polygon reuse
+    the index instead of classifying the cells again.
+    """
+    vertices_x, vertices_y = zip(*vertices)
+    return GridIndex(vertices_x, vertices_y, resolution)
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import os
+import threading
+import time
+import uuid
+
+from app.cache import ComputationCancelled
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+JOB_HISTORY_SIZE = int(os.environ.get('JOB_HISTORY_SIZE', 1000))
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    finished = "finished"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobCancelled(ComputationCancelled):
+    pass
+
+
+class Job:
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = JobStatus.queued
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    def check_cancelled(self):
+        """
+        Called by the running computation between chunks, stops it once the job was cancelled.
+        """
+        if self.cancel_requested.is_set():
+            raise JobCancelled(f"Job {self.id} has been cancelled")
+
+    def is_done(self):
+        return self.status in (JobStatus.finished, JobStatus.failed, JobStatus.cancelled)
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status.value, 'progress': self.progress, 'result': self.result,
+                'error': self.error, 'created_at': self.created_at, 'started_at': self.started_at,
+                'finished_at': self.finished_at}
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool. At most max_queue_size jobs may wait for a free worker,
+    further submissions are rejected with JobQueueFull. Only the last history_size finished jobs
+    are kept.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queue_size=JOB_QUEUE_SIZE, history_size=JOB_HISTORY_SIZE):
+        self.max_queue_size = max_queue_size
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, function):
+        """
+        Schedules function(job) and returns the job right away. The value returned by the function
+        becomes the job result.
+        """
+        with self._lock:
+            queued = sum(job.status == JobStatus.queued for job in self._jobs.values())
+            if queued >= self.max_queue_size:
+                raise JobQueueFull(f"Job queue is full ({queued} jobs waiting)")
+            job = Job()
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+            job.future = self._executor.submit(self._run, job, function)
+        return job
+
+    def _run(self, job, function):
+        with self._lock:
+            if job.cancel_requested.is_set():
+                return
+            job.status = JobStatus.running
+            job.started_at = time.time()
+        try:
+            result = function(job)
+        except JobCancelled:
+            status, result, error = JobStatus.cancelled, None, None
+        except Exception as exception:
+            status, result, error = JobStatus.failed, None, str(getattr(exception, 'detail', exception))
+        else:
+            status, error = JobStatus.finished, None
+        with self._lock:
+            # cancelled while the result was being returned, e.g. by a computation shared with another request
+            if status == JobStatus.finished and job.cancel_requested.is_set():
+                status, result = JobStatus.cancelled, None
+            job.status, job.result, job.error = status, result, error
+            if status == JobStatus.finished:
+                job.progress = 1.0
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_done():
+                return job
+            job.cancel_requested.set()
+            if job.status == JobStatus.queued:
+                job.future.cancel()
+                job.status = JobStatus.cancelled
+                job.finished_at = time.time()
+        return job
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_done()]
+        for job_id in finished[:max(len(finished) - self.history_size, 0)]:
+            del self._jobs[job_id]
@@ -1,18 +1,49 @@
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import os
 import json
+import math
+import queue
+import threading
 import time
 from typing import List, Union
+from urllib.parse import quote
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends, Request
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, Response
+
+from app.cache import ComputationCancelled, ResultCache
+from app.figure_store import FigureStore, get_figure_key, get_validators, is_not_modified
+from app.jobs import JobManager, JobQueueFull
+from app.metrics import Span, TimingMiddleware, get_metrics_text, observe_monte_carlo
+from app.rendering import figure_pool, get_png, draw_result, directory, RenderModes, warm_up_rendering
+from app.utils import (estimate_area, estimate_areas, draw_estimate, get_domain_area, get_union_bounding_box,
+                       warm_up_estimates, MAX_WORKERS, PeakMemoryTracker)
+from app.figures import Point, PointSet, Line, Polygon, Circle, Ball
+from app.samplers import Dtypes, Samplers
+from app.response_models_v2 import (Colors, Engines, StreamFormats, ItemColoredPoint, ItemLine, ItemCircle, ItemBall,
+                                    ItemFigure, ItemAreaBatch, AreaResponse, BatchAreaResponse, JobResponse)
+
+# opt-in, new workers render a figure and run small estimates before they take traffic
+WARM_UP = os.environ.get('WARM_UP', '0') == '1'
+# streams computed at the same time, further streams wait for a free worker
+STREAM_WORKERS = int(os.environ.get('STREAM_WORKERS', 4))
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+app = FastAPI()
+app.add_middleware(TimingMiddleware)
+area_cache = ResultCache()
+figure_store = FigureStore()
+job_manager = JobManager()
+stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix='area-stream')
 
-from app.utils import get_fig_base, calculate_area_monte_carlo, directory
-from app.figures import Point, Line, Polygon, Circle
-from app.response_models_v2 import (Colors, ItemColoredPoint, ItemLine, ItemCircle, AreaResponse)
 
-app = FastAPI()
+@app.on_event("startup")
+def warm_up():
+    if WARM_UP:
+        warm_up_rendering()
+        warm_up_estimates()
 
 
 @app.get("/")
@@ -23,16 +54,45 @@ def index():
     return {"message": "Hello! This is a practical introduction to FastApi"}
 
 
+def get_figure_store_key(filename):
+    return filename[:-len('.png')] if filename.endswith('.png') else filename
+
+
 @app.get("/get_figure/{filename}")
-def get_figure(filename: str):
+def get_figure(filename: str, request: Request):
     """
-    Returns png file specified by filename or 404 error if the file does not exist.
+    Returns png file specified by filename or 404 error if the file does not exist. Rendered
+    figures are found under the ETag returned with them, <etag>.png. Responses carry ETag and
+    Last-Modified, a request with a matching If-None-Match or If-Modified-Since gets 304.
     """
+    key = get_figure_store_key(filename)
+    stored = figure_store.read(key)
+    if stored is not None:
+        content, stat = stored
+        headers = {**get_validators(stat, key), 'Cache-Control': 'public, max-age=31536000, immutable'}
+        if is_not_modified(request.headers, headers):
+            return Response(status_code=304, headers=headers)
+        return get_png_response(content, filename, headers)
     path_to_file = os.path.join(directory, filename)
-    if os.path.isfile(path_to_file):
-        return FileResponse(path=path_to_file, filename=filename, media_type="image/png")
-    else:
+    if not os.path.isfile(path_to_file):
         raise HTTPException(status_code=404, detail=f"File {filename} not found!")
+    headers = {**get_validators(path_to_file), 'Cache-Control': 'no-cache'}
+    if is_not_modified(request.headers, headers):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=path_to_file, filename=filename, media_type="image/png", headers=headers)
+
+
+def get_png_response(content, filename, headers):
+    """
+    Stored figures are sent from memory, read while the file was known to exist, as a download
+    named filename like FileResponse sends it.
+    """
+    quoted = quote(filename)
+    if quoted != filename:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    return Response(content=content, media_type="image/png", headers={**headers, 'Content-Disposition': disposition})
 
 
 @app.delete("/delete_figure/")
@@ -40,6 +100,8 @@ def delete_figure(filename: str):
     """
     Deletes file specified by filename or 404 error if the file does not exist.
     """
+    if figure_store.delete(get_figure_store_key(filename)):
+        return {"message": f"figure {filename} has been deleted"}
     path_to_file = os.path.join(directory, filename)
     if os.path.isfile(path_to_file):
         os.remove(path_to_file)
@@ -53,15 +115,13 @@ def create_points(points: List[ItemColoredPoint]):
     """
     Method creates a point based on the given coordinates in 2D.
     """
-    fig, ax = get_fig_base()
-
-    for colored_point in points:
-        point = Point(**colored_point.dict())
-        point.draw_point(fig, ax, color=colored_point.color, s=colored_point.size)
-
-    output = BytesIO()
-    FigureCanvas(fig).print_png(output)
-    return StreamingResponse(BytesIO(output.getvalue()), media_type="image/png")
+    with figure_pool.get_figure() as (fig, ax):
+        with Span('plot'):
+            for colored_point in points:
+                point = Point(colored_point.name, colored_point.x, colored_point.y)
+                point.draw_point(fig, ax, color=colored_point.color, s=colored_point.size)
+        png = get_png(fig)
+    return StreamingResponse(BytesIO(png), media_type="image/png")
 
 
 @app.post("/create_line", status_code=201, response_class=StreamingResponse)
@@ -74,99 +134,474 @@ def create_line(line: ItemLine, color: Colors = 'black', linewidth: int = 2):
     point_2 = Point(**line_dict['ending_point'])
     line = Line.create_line_from_points(point_1, point_2)
 
-    fig, ax = get_fig_base()
-    line.draw_line(fig, ax, color=color, linewidth=linewidth)
-    output = BytesIO()
-    FigureCanvas(fig).print_png(output)
-    return StreamingResponse(BytesIO(output.getvalue()), media_type="image/png")
+    with figure_pool.get_figure() as (fig, ax):
+        with Span('plot'):
+            line.draw_line(fig, ax, color=color, linewidth=linewidth)
+        png = get_png(fig)
+    return StreamingResponse(BytesIO(png), media_type="image/png")
 
 
 @app.post("/create_circle", status_code=201, response_class=StreamingResponse)
 def create_circle(circle: ItemCircle, color: Colors = 'black', linewidth: int = 2):
     o = Point(**circle.dict()['center'])
     circle = Circle(o, circle.radius)
-    fig, ax = get_fig_base()
-    circle.draw(fig, ax, color=color, linewidth=linewidth)
-    output = BytesIO()
-    FigureCanvas(fig).print_png(output)
-    return StreamingResponse(BytesIO(output.getvalue()), media_type="image/png")
+    with figure_pool.get_figure() as (fig, ax):
+        with Span('plot'):
+            circle.draw(fig, ax, color=color, linewidth=linewidth)
+        png = get_png(fig)
+    return StreamingResponse(BytesIO(png), media_type="image/png")
 
 
-@app.post("/calculate_area_circle", response_model=AreaResponse)
-def calculate_area_circle(circle: ItemCircle, number_of_points: int = 100, filename: Union[None, str] = None):
+class MonteCarloParams:
     """
-    Calculates area of the circle with specified radius. The whole circle should
-    fit in square between 0 and 1 (required by monte carlo function).
+    Query parameters shared by the area endpoints. When target_standard_error or relative_tolerance
+    is given, sampling stops as soon as the confidence interval is tight enough and
+    number_of_points is only the upper limit. The same seed and number_of_points give the same
+    area for any number of workers.
+    Points are sampled from the figure's bounding box unless all four box_* borders are given.
+    sampler selects pseudo-random points or a (scrambled) Halton or Sobol low-discrepancy sequence.
+    Without chunk_size the chunks are sized to fit the per-request memory budget, requests with
+    a chunk_size over the budget are rejected.
+    engine selects the exact area, the Monte Carlo estimate, or both together with the error of
+    the estimate.
+    render selects how the samples are drawn when a filename is given: a scatter plot, a density
+    image, or auto, which switches to the density image for large chunks.
+    dtype is the precision of the sampled coordinates and the containment tests. float32 is faster,
+    its samples are taken relative to the corner of the sampling box and rounded by about 6e-8 of
+    the box size, far below the Monte Carlo noise also for figures far from the origin.
     """
 
-    o = Point(**circle.dict()['center'])
-    min_x = min(o.x, 1 - o.x)
-    min_y = min(o.y, 1 - o.y)
+    def __init__(self, engine: Engines = Engines.monte_carlo, number_of_points: int = Query(default=100, gt=0),
+                 chunk_size: Union[int, None] = Query(default=None, gt=0),
+                 target_standard_error: Union[float, None] = Query(default=None, gt=0),
+                 relative_tolerance: Union[float, None] = Query(default=None, gt=0, lt=1),
+                 confidence: float = Query(default=0.95, gt=0, lt=1),
+                 seed: Union[int, None] = Query(default=None, ge=0),
+                 workers: int = Query(default=1, ge=1, le=MAX_WORKERS),
+                 sampler: Samplers = Samplers.random,
+                 box_left: Union[float, None] = None, box_right: Union[float, None] = None,
+                 box_bottom: Union[float, None] = None, box_top: Union[float, None] = None,
+                 render: RenderModes = RenderModes.auto, dtype: Dtypes = Dtypes.float64):
+        self.engine = engine
+        self.number_of_points = number_of_points
+        self.chunk_size = chunk_size
+        self.target_standard_error = target_standard_error
+        self.relative_tolerance = relative_tolerance
+        self.confidence = confidence
+        self.seed = seed
+        self.workers = workers
+        self.sampler = sampler
+        self.domain = self.get_domain(box_left, box_right, box_bottom, box_top)
+        self.render = render
+        self.dtype = dtype
+
+    def get_key(self):
+        # workers and render are left out, they do not change the result
+        return (self.engine.value, self.number_of_points, self.seed, self.chunk_size, self.target_standard_error,
+                self.relative_tolerance, self.confidence, self.sampler.value, self.domain, self.dtype.value)
+
+    @staticmethod
+    def get_domain(left, right, bottom, top):
+        borders = (left, right, bottom, top)
+        if all(border is None for border in borders):
+            return None
+        if any(border is None for border in borders):
+            raise HTTPException(status_code=400, detail="Sampling box needs all of box_left, box_right, "
+                                                        "box_bottom and box_top!")
+        if not (left < right and bottom < top):
+            raise HTTPException(status_code=400, detail="Sampling box must have positive width and height!")
+        return borders
+
+
+def compute_area(figure, params, progress_callback=None):
+    response = {'engine': params.engine.value}
+    if params.engine != Engines.monte_carlo:
+        with Span('exact'):
+            response['area'] = response['exact_area'] = figure.get_area()
+
+    if params.engine != Engines.exact:
+        try:
+            with PeakMemoryTracker() as memory, Span('monte_carlo') as monte_carlo:
+                result = estimate_area(figure, params.number_of_points, chunk_size=params.chunk_size,
+                                       target_standard_error=params.target_standard_error,
+                                       relative_tolerance=params.relative_tolerance,
+                                       confidence=params.confidence, seed=params.seed, workers=params.workers,
+                                       domain=params.domain, sampler=params.sampler, dtype=params.dtype,
+                                       progress_callback=progress_callback)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        observe_monte_carlo(result.number_of_points, monte_carlo.seconds)
+        response['peak_memory_mb'] = round(memory.peak / 2 ** 20, 2)
+        response.update(result.to_dict())
+
+    if params.engine == Engines.both:
+        response['error'] = response['area'] - response['exact_area']
+        response['relative_error'] = response['error'] / response['exact_area'] if response['exact_area'] else None
+    return response
+
+
+def get_area_result(figure, figure_name, params, progress_callback=None, check_cancelled=None):
+    """
+    Monte Carlo results are cached on the canonical geometry and the request parameters, exact-only
+    requests are not cached. Unseeded results are only shared with identical requests arriving
+    while they are computed, repeated unseeded requests get independent estimates. A request
+    waiting for an identical one gets its progress and is stopped by check_cancelled.
+    """
+    start_time = time.perf_counter()
+    if params.engine != Engines.exact:
+        key = (figure.get_canonical_key(), params.get_key())
+
+        def report_progress(result):
+            # a copy, the result keeps changing while the waiting requests read it
+            area_cache.publish_progress(key, copy.copy(result))
+            if progress_callback is not None:
+                progress_callback(result)
+        result, cached = area_cache.get_or_compute(key, lambda: compute_area(figure, params, report_progress),
+                                                   progress_callback, check_cancelled, store=params.seed is not None)
+    else:
+        result, cached = compute_area(figure, params, progress_callback), False
+    return {'figure': figure_name, **result, 'cached': cached, 'time': round(time.perf_counter() - start_time, 6)}
 
-    if not (min_x > circle.radius and min_y > circle.radius):
-        raise HTTPException(status_code=400, detail="Wrong center coordinates! This circle wont fit into unit square")
 
-    start_time = time.time()
-    circle = Circle(o, circle.radius)
-    area = calculate_area_monte_carlo(circle, number_of_points, filename=filename)
-    time_taken = round(time.time() - start_time, 2)
-    if filename is None:
-        return {'figure': 'circle', 'area': area, 'time': time_taken}
+def render_area_figure(figures, params, results, path):
+    if params.engine == Engines.exact:
+        draw_result(figures, domain=get_union_bounding_box(figures), filename=path)
+        return
+    adaptive = params.target_standard_error is not None or params.relative_tolerance is not None
+    draw_estimate(figures, params.number_of_points, results[0]['seed'], tuple(results[0]['sampling_box']),
+                  params.chunk_size, adaptive, params.sampler, filename=path, render=params.render, dtype=params.dtype)
 
-    path = os.path.join(directory, filename)
-    headers = {'figure': filename, "time": str(time_taken), "area": str(area)}
-    return FileResponse(path=path, filename=filename, media_type="image/png", headers=headers)
 
+def get_area_figure_key(figures, params, results=None):
+    """
+    The seed the estimate resolved to is part of the key, so a figure of an unseeded request is
+    never served with the area of other samples once the cached result is gone.
+    """
+    seed = results[0].get('seed') if results else params.seed
+    keys = tuple(figure.get_canonical_key() for figure in figures)
+    return get_figure_key(keys, params.get_key(), params.render.value, seed)
 
-@app.post("/calculate_area_poly_from_bytes/")
-def calculate_area_poly_from_bytes(file: bytes = File(default=..., description="file to be uploaded"),
-                                   number_of_points: int = 100, filename: Union[str, None] = None):
+
+def store_area_figure(figures, params, results):
     """
-    Calculates area of the polygon build from the specified vertices. The whole polygon should
-    fit in square between 0 and 1 (required by monte carlo function).
-    This method accepts json file as the input data.
+    Renders the figures with the first chunk of samples of their estimate into the figure store,
+    unless the same geometry was already rendered with the same parameters. Returns the store key.
+    """
+    key = get_area_figure_key(figures, params, results)
+    figure_store.get_or_render(key, lambda path: render_area_figure(figures, params, results, path))
+    return key
+
+
+def get_stored_figure_response(request, figures, params, filename, get_results):
+    """
+    PNG response for the area endpoints called with a filename, which is only the name of the
+    download. get_results returns (results, headers); it is not called at all when the request
+    revalidates a stored figure with If-None-Match or If-Modified-Since, which gets 304. Unseeded
+    estimates are not known before they are computed, they are never revalidated.
     """
-    json_data = json.load(BytesIO(file))
-    print(type(file))
-    print(json_data)
+    if params.seed is not None or params.engine == Engines.exact:
+        key = get_area_figure_key(figures, params)
+        stored = figure_store.read(key)
+        if stored is not None:
+            validators = get_validators(stored[1], key)
+            if is_not_modified(request.headers, validators):
+                return Response(status_code=304, headers=validators)
+
+    results, headers = get_results()
+    key = get_area_figure_key(figures, params, results)
+    content, stat = figure_store.read(key, lambda path: render_area_figure(figures, params, results, path))
+    return get_png_response(content, filename, {**headers, **get_validators(stat, key)})
 
-    start_time = time.time()
-    vertices_points = [Point(**v) for v in json_data['vertices']]
-    polygon = Polygon(vertices_points)
-    area = calculate_area_monte_carlo(polygon, number_of_points, filename=filename)
-    time_taken = round(time.time() - start_time, 2)
 
+def get_area_response(request, figure, figure_name, params, filename=None):
     if filename is None:
-        return {'figure': json_data['name'], 'area': area, 'time': time_taken}
+        return get_area_result(figure, figure_name, params)
 
-    path = os.path.join(directory, filename)
-    headers = {'figure': json_data['name'], "time": str(time_taken), "area": str(area)}
-    return FileResponse(path=path, filename=filename, media_type="image/png", headers=headers)
+    def get_results():
+        response = get_area_result(figure, figure_name, params)
+        return [response], {key: str(value) for key, value in response.items() if value is not None}
+    return get_stored_figure_response(request, [figure], params, filename, get_results)
 
 
-@app.post("/calculate_area_poly_from_file/")
-def calculate_area_poly_from_file(file: UploadFile, number_of_points: int = 100,
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Request and phase duration histograms and Monte Carlo throughput in the Prometheus text format.
+    """
+    return PlainTextResponse(get_metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache")
+def get_cache_stats():
+    """
+    Returns size and hit/miss counters of the area result cache.
+    """
+    return area_cache.get_stats()
+
+
+@app.delete("/cache")
+def clear_cache():
+    """
+    Removes all entries from the area result cache.
+    """
+    area_cache.clear()
+    return {"message": "area cache has been cleared"}
+
+
+@app.post("/calculate_area_circle", response_model=AreaResponse)
+def calculate_area_circle(circle: ItemCircle, request: Request, params: MonteCarloParams = Depends(),
+                          filename: Union[None, str] = None):
+    """
+    Calculates area of the circle with specified radius. By default points are sampled from the
+    bounding box of the circle, so the circle does not have to fit in square between 0 and 1.
+    Points are sampled in chunks of chunk_size, so number_of_points may go into the billions.
+    """
+
+    with Span('construction'):
+        circle = Circle(Point(**circle.dict()['center']), circle.radius)
+    return get_area_response(request, circle, 'circle', params, filename)
+
+
+@app.post("/calculate_volume_ball", response_model=AreaResponse)
+def calculate_volume_ball(ball: ItemBall, request: Request, params: MonteCarloParams = Depends()):
+    """
+    Calculates the volume of a ball in up to 20 dimensions, returned as area. Points are sampled
+    from the bounding cube of the ball with the random sampler. The fraction of the cube inside
+    the ball drops quickly with the dimension (0.52 for 3, 2.5e-3 for 10 and 2.5e-8 for 20
+    dimensions), so high dimensions need a very large number_of_points; they are sampled in
+    chunks sized to the memory budget and may be spread over workers.
+    """
+    if params.domain is not None:
+        raise HTTPException(status_code=400, detail="Balls are always sampled from their bounding cube!")
+    with Span('construction'):
+        figure = Ball(ball.center, ball.radius)
+    if not math.isfinite(get_domain_area(figure.get_bounding_box())):
+        raise HTTPException(status_code=400, detail="The bounding cube of the ball is too large!")
+    return get_area_response(request, figure, ball.name or f"ball_{figure.dimension}d", params)
+
+
+@app.post("/calculate_area_poly_from_bytes/", response_model=AreaResponse)
+def calculate_area_poly_from_bytes(request: Request,
+                                   file: bytes = File(default=..., description="file to be uploaded"),
+                                   params: MonteCarloParams = Depends(),
+                                   filename: Union[str, None] = None):
+    """
+    Calculates area of the polygon build from the specified vertices. By default points are
+    sampled from the bounding box of the polygon.
+    This method accepts json file as the input data.
+    """
+    with Span('parse'):
+        json_data = json.load(BytesIO(file))
+    with Span('construction'):
+        polygon = create_polygon(PointSet.from_dicts(json_data['vertices']), json_data.get('keep_order', False))
+    return get_area_response(request, polygon, json_data['name'], params, filename)
+
+
+@app.post("/calculate_area_poly_from_file/", response_model=AreaResponse)
+def calculate_area_poly_from_file(file: UploadFile, request: Request, params: MonteCarloParams = Depends(),
                                   filename: Union[str, None] = None):
     """
-    Calculates area of the polygon build from the specified vertices. The whole polygon should
-    fit in square between 0 and 1 (required by monte carlo function).
+    Calculates area of the polygon build from the specified vertices. By default points are
+    sampled from the bounding box of the polygon.
     This method accepts json file as the input data.
     """
+    with Span('parse'):
+        json_data = json.load(file.file)
+    with Span('construction'):
+        polygon = create_polygon(PointSet.from_dicts(json_data['vertices']), json_data.get('keep_order', False))
+    return get_area_response(request, polygon, json_data['name'], params, filename)
+
+
+def create_figure(item):
+    with Span('construction'):
+        if item.circle is not None:
+            figure = Circle(Point(**item.circle.center.dict()), item.circle.radius)
+            return figure, item.name or 'circle'
+        figure = create_polygon(PointSet.from_points(item.polygon.vertices), item.polygon.keep_order)
+        return figure, item.name or item.polygon.name or 'polygon'
 
-    json_data = json.load(file.file)
-    print(file.file)
-    print(file.content_type)
-    print(json_data)
 
-    start_time = time.time()
-    vertices_points = [Point(**v) for v in json_data['vertices']]
-    polygon = Polygon(vertices_points)
-    area = calculate_area_monte_carlo(polygon, number_of_points, filename=filename)
-    time_taken = round(time.time() - start_time, 2)
+def create_polygon(vertices, keep_order=False):
+    """
+    Vertices sorted by angle always give a simple polygon, vertices in the given order may give an
+    outline that crosses itself, which has no area the estimates could agree on.
+    """
+    polygon = Polygon(vertices, keep_order)
+    if keep_order and polygon.is_simple() is False:
+        raise HTTPException(status_code=400, detail="Edges of the polygon cross, give its vertices in boundary order!")
+    return polygon
 
+
+@app.post("/calculate_area_batch", response_model=BatchAreaResponse)
+def calculate_area_batch(batch: ItemAreaBatch, request: Request, params: MonteCarloParams = Depends(),
+                         filename: Union[str, None] = None):
+    """
+    Calculates areas of up to 100 circles and polygons at once. All figures are tested against
+    one shared cloud of points, sampled from the union of their bounding boxes unless a box is
+    given, so differences between the areas are estimated much more precisely than from separate
+    requests. Adaptive runs stop when every figure reached the requested precision.
+    """
+    figures, figure_names = zip(*[create_figure(item) for item in batch.figures])
     if filename is None:
-        return {'figure': json_data['name'], 'area': area, 'time': time_taken}
+        return compute_batch_areas(figures, figure_names, params)
+
+    def get_results():
+        response = compute_batch_areas(figures, figure_names, params)
+        results = response['results']
+        return results, {'time': str(response['time']), 'areas': json.dumps([result['area'] for result in results])}
+    return get_stored_figure_response(request, figures, params, filename, get_results)
+
+
+def compute_batch_areas(figures, figure_names, params):
+    start_time = time.perf_counter()
+    results = [{'figure': figure_name, 'engine': params.engine.value} for figure_name in figure_names]
+    if params.engine != Engines.monte_carlo:
+        with Span('exact'):
+            for figure, result in zip(figures, results):
+                result['area'] = result['exact_area'] = figure.get_area()
+
+    peak_memory_mb = None
+    if params.engine != Engines.exact:
+        try:
+            with PeakMemoryTracker() as memory, Span('monte_carlo') as monte_carlo:
+                estimates = estimate_areas(list(figures), params.number_of_points, chunk_size=params.chunk_size,
+                                           target_standard_error=params.target_standard_error,
+                                           relative_tolerance=params.relative_tolerance,
+                                           confidence=params.confidence, seed=params.seed, workers=params.workers,
+                                           domain=params.domain, sampler=params.sampler, dtype=params.dtype)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        observe_monte_carlo(estimates[0].number_of_points, monte_carlo.seconds)
+        peak_memory_mb = round(memory.peak / 2 ** 20, 2)
+        for result, estimate in zip(results, estimates):
+            result.update(estimate.to_dict())
+
+    if params.engine == Engines.both:
+        for result in results:
+            result['error'] = result['area'] - result['exact_area']
+            result['relative_error'] = result['error'] / result['exact_area'] if result['exact_area'] else None
+    elapsed = round(time.perf_counter() - start_time, 6)
+    for result in results:
+        result['time'] = elapsed
+
+    return {'results': results, 'time': elapsed, 'peak_memory_mb': peak_memory_mb}
+
+
+class StreamClosed(ComputationCancelled):
+    pass
+
+
+def format_stream_event(event, data, stream_format):
+    if stream_format == StreamFormats.sse:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({'event': event, **data}) + "\n"
+
+
+@app.post("/calculate_area_stream")
+async def calculate_area_stream(item: ItemFigure, request: Request, params: MonteCarloParams = Depends(),
+                                format: StreamFormats = StreamFormats.ndjson):
+    """
+    Calculates area of a circle or a polygon and streams the running estimate after every chunk
+    of points as NDJSON lines or server-sent events: "progress" events with the area so far,
+    number of points, confidence interval and elapsed time, then one "result" event with the same
+    fields as the area endpoints, or an "error" event. When the client disconnects the computation
+    stops after the current chunk. At most STREAM_WORKERS streams are computed at a time.
+    """
+    figure, figure_name = create_figure(item)
+    updates = queue.Queue()
+    closed = threading.Event()
+    start_time = time.perf_counter()
+
+    def check_closed():
+        if closed.is_set():
+            raise StreamClosed("Client disconnected")
+
+    def report_progress(result):
+        check_closed()
+        updates.put(('progress', {'figure': figure_name, 'area': result.area, 'standard_error': result.standard_error,
+                                  'confidence_interval': list(result.get_confidence_interval()),
+                                  'number_of_points': result.number_of_points,
+                                  'progress': min(result.number_of_points / params.number_of_points, 1.0),
+                                  'elapsed': round(time.perf_counter() - start_time, 6)}))
+
+    def run():
+        try:
+            if closed.is_set():
+                return
+            updates.put(('result', get_area_result(figure, figure_name, params, progress_callback=report_progress,
+                                                   check_cancelled=check_closed)))
+        except StreamClosed:
+            pass
+        except Exception as error:
+            updates.put(('error', {'detail': str(getattr(error, 'detail', error))}))
+        finally:
+            updates.put(None)
+
+    async def stream_events():
+        try:
+            while True:
+                try:
+                    update = updates.get_nowait()
+                except queue.Empty:
+                    if await request.is_disconnected():
+                        break
+                    await asyncio.sleep(0.05)
+                    continue
+                if update is None:
+                    break
+                yield format_stream_event(*update, format)
+        finally:
+            closed.set()
+            future.cancel()
+
+    future = stream_executor.submit(run)
+    media_type = "text/event-stream" if format == StreamFormats.sse else "application/x-ndjson"
+    return StreamingResponse(stream_events(), media_type=media_type)
+
+
+@app.post("/jobs", status_code=202, response_model=JobResponse)
+def submit_job(item: ItemFigure, params: MonteCarloParams = Depends(), filename: Union[str, None] = None):
+    """
+    Queues calculation of the area of a circle or a polygon and returns the job id right away.
+    Accepts the same query parameters as the area endpoints. Returns 503 when the job queue is full.
+    With a filename the figure is rendered too, the result names it in image, see /get_figure.
+    """
+    figure, figure_name = create_figure(item)
+
+    def run(job):
+        def report_progress(result):
+            job.progress = min(result.number_of_points / params.number_of_points, 1.0)
+            job.check_cancelled()
+        result = get_area_result(figure, figure_name, params, progress_callback=report_progress,
+                                 check_cancelled=job.check_cancelled)
+        if filename is not None:
+            result['image'] = f"{store_area_figure([figure], params, [result])}.png"
+        return result
+
+    try:
+        job = job_manager.submit(run)
+    except JobQueueFull as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    """
+    Returns status, progress and, once finished, the result of the job.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found!")
+    return job.to_dict()
+
 
-    path = os.path.join(directory, filename)
-    headers = {'figure': json_data['name'], "time": str(time_taken), "area": str(area)}
-    return FileResponse(path=path, filename=filename, media_type="image/png", headers=headers)
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+def cancel_job(job_id: str):
+    """
+    Cancels a queued or running job. A running job stops after its current chunk of points.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found!")
+    return job.to_dict()
@@ -0,0 +1,169 @@
+from contextvars import ContextVar
+import threading
+import time
+
+from starlette.datastructures import MutableHeaders
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8, 3e8, 1e9)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class Timings:
+    """
+    Durations of the phases of one request in seconds, in the order the phases were first
+    entered. A phase entered more than once is summed.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, phase, seconds):
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+
+    def get_header(self):
+        return ", ".join(f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in self.durations.items())
+
+
+class Span:
+    """
+    Measures the with block with perf_counter and adds it to the timings of the current request.
+    Outside of a request (worker processes, jobs, tests) only the seconds attribute is set.
+    """
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.start = 0.0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.start
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add(self.phase, self.seconds)
+
+
+def format_labels(label_name, label, **extra):
+    labels = {label_name: label, **extra} if label_name else extra
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+class Counter:
+
+    def __init__(self, name, documentation, label_name=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1.0, label=None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0.0) + value
+
+    def get_lines(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label, value in self._values.items():
+                lines.append(f"{self.name}{format_labels(self.label_name, label)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram with cumulative buckets and an optional label.
+    """
+
+    def __init__(self, name, documentation, label_name=None, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        # label: [count per bucket, sum, number of observations]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label=None):
+        with self._lock:
+            series = self._series.setdefault(label, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get_lines(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label, (counts, total, observations) in self._series.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_name, label, le=bound)} {count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.label_name, label, le='+Inf')} {observations}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_name, label)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.label_name, label)} {observations}")
+        return lines
+
+
+request_duration = Histogram('http_request_duration_seconds', "Time from receiving a request to sending "
+                             "the response headers", 'endpoint')
+phase_duration = Histogram('area_phase_duration_seconds', "Time spent in one phase of a request", 'phase')
+samples_total = Counter('monte_carlo_samples_total', "Monte Carlo points sampled and classified")
+sampling_seconds_total = Counter('monte_carlo_seconds_total', "Time spent on Monte Carlo estimates")
+throughput = Histogram('monte_carlo_throughput_samples_per_second', "Monte Carlo points per second of one "
+                       "estimate", buckets=THROUGHPUT_BUCKETS)
+METRICS = (request_duration, phase_duration, samples_total, sampling_seconds_total, throughput)
+
+
+def observe_monte_carlo(number_of_points, seconds):
+    samples_total.inc(number_of_points)
+    sampling_seconds_total.inc(seconds)
+    if seconds > 0:
+        throughput.observe(number_of_points / seconds)
+
+
+def get_metrics_text():
+    return "\n".join(line for metric in METRICS for line in metric.get_lines()) + "\n"
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware collecting the Span timings of every HTTP request. They are sent in the
+    Server-Timing header together with the total time until the response headers, and added to
+    the request and phase histograms. Streamed responses report the phases done before the
+    first chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = current_timings.set(timings)
+        start_time = time.perf_counter()
+
+        async def send_with_timings(message):
+            if message['type'] == 'http.response.start':
+                total = time.perf_counter() - start_time
+                endpoint = scope.get('endpoint')
+                request_duration.observe(total, getattr(endpoint, '__name__', 'unmatched'))
+                for phase, seconds in timings.durations.items():
+                    phase_duration.observe(seconds, phase)
+                timings.add('total', total)
+                MutableHeaders(scope=message).append('Server-Timing', timings.get_header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
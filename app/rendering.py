@@ -0,0 +1,207 @@
+import os
+import threading
+from contextlib import contextmanager
+from enum import Enum
+from io import BytesIO
+import numpy as np
+from app.metrics import Span
+
+directory = 'figures'
+
+UNIT_SQUARE = (0.0, 1.0, 0.0, 1.0)
+# above this number of samples the auto render mode bins them into a density raster
+SCATTER_MAX_POINTS = 20000
+DENSITY_BINS = 256
+# samples binned at a time into the density image, a multiple of 8 so packed masks split on whole bytes
+DENSITY_CHUNK_SIZE = 2 ** 18
+FIGURE_POOL_SIZE = int(os.environ.get('FIGURE_POOL_SIZE', 8))
+
+
+def get_fig_base(xlim=(-0.1, 1.1), ylim=(-0.1, 1.1)):
+    """
+    Figures are created through the object oriented API with their own Agg canvas, they are not
+    registered with pyplot and are freed as soon as they are no longer referenced. In a notebook
+    show them with display(fig).
+    matplotlib is imported with the first figure, processes that only compute areas never load it.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.grid(color='gray', alpha=0.4)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_xlabel('x')
+    ax.set_ylabel('y')
+    return fig, ax
+
+
+def get_png(fig):
+    output = BytesIO()
+    with Span('encode'):
+        fig.canvas.print_png(output)
+    return output.getvalue()
+
+
+class FigurePool:
+    """
+    Thread-safe pool of styled base figures. A figure is used by one request at a time and is
+    reset when it is given back: everything drawn on it is removed, the color cycle and the axis
+    limits are restored. At most max_size idle figures are kept, the rest is left to the garbage
+    collector, so memory stays flat however many figures are rendered.
+    """
+
+    def __init__(self, max_size=FIGURE_POOL_SIZE):
+        self.max_size = max_size
+        self._figures = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get_figure(self, xlim=(-0.1, 1.1), ylim=(-0.1, 1.1)):
+        with self._lock:
+            fig, ax = self._figures.pop() if self._figures else get_fig_base()
+        try:
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*ylim)
+            yield fig, ax
+        finally:
+            self.release(fig, ax)
+
+    def release(self, fig, ax):
+        for artist in [*ax.lines, *ax.collections, *ax.images, *ax.texts, *ax.patches]:
+            artist.remove()
+        ax.set_prop_cycle(None)
+        with self._lock:
+            if len(self._figures) < self.max_size:
+                self._figures.append((fig, ax))
+
+    def __len__(self):
+        return len(self._figures)
+
+
+figure_pool = FigurePool()
+
+
+class PackedMask:
+    """
+    Boolean mask of samples stored with np.packbits, one bit instead of one byte per sample, for
+    masks that are kept while other figures are classified and passed on to draw_samples.
+    """
+
+    def __init__(self, bits, size):
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def pack(cls, mask):
+        mask = np.asarray(mask, dtype=bool).ravel()
+        return cls(np.packbits(mask), mask.size)
+
+    def __ior__(self, other):
+        if other.size != self.size:
+            raise ValueError(f"Masks of {self.size} and {other.size} samples cannot be combined")
+        self.bits |= other.bits
+        return self
+
+    def unpack(self, start=0, stop=None):
+        """
+        Samples start to stop as a bool array, start must be a multiple of 8.
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        return np.unpackbits(self.bits[start // 8:(stop + 7) // 8], count=stop - start).view(bool)
+
+
+class RenderModes(str, Enum):
+    auto = "auto"
+    scatter = "scatter"
+    density = "density"
+
+
+def draw_samples(fig, ax, coordinates, inside, s=5, render=RenderModes.auto, domain=None):
+    """
+    Draws the samples either as one scatter layer per class or, for more than SCATTER_MAX_POINTS
+    samples in auto mode, as a single density image, whose cost does not grow with the number of
+    samples. Pixel hue goes from red to green with the fraction of samples inside, opacity follows
+    the number of samples in the pixel.
+    inside is a bool array or a PackedMask. The density image bins the samples in chunks of
+    DENSITY_CHUNK_SIZE, so a packed mask is only unpacked one chunk at a time.
+    """
+    render = RenderModes(render)
+    if render == RenderModes.scatter or (render == RenderModes.auto and len(coordinates) <= SCATTER_MAX_POINTS):
+        if isinstance(inside, PackedMask):
+            inside = inside.unpack()
+        ax.scatter(coordinates[inside, 0], coordinates[inside, 1], color='green', s=s)
+        ax.scatter(coordinates[~inside, 0], coordinates[~inside, 1], color='red', s=s)
+        return
+
+    if domain is None:
+        domain = (coordinates[:, 0].min(), coordinates[:, 0].max(), coordinates[:, 1].min(), coordinates[:, 1].max())
+    left, right, bottom, top = domain
+    counts = np.zeros(DENSITY_BINS ** 2, dtype=np.int64)
+    counts_inside = np.zeros(DENSITY_BINS ** 2, dtype=np.int64)
+    for start in range(0, len(coordinates), DENSITY_CHUNK_SIZE):
+        chunk = coordinates[start:start + DENSITY_CHUNK_SIZE]
+        if isinstance(inside, PackedMask):
+            chunk_inside = inside.unpack(start, start + len(chunk))
+        else:
+            chunk_inside = inside[start:start + len(chunk)]
+        # np.histogram2d sorts the samples, binning through integer cell indices is several times faster
+        columns = np.clip(((chunk[:, 0] - left) * (DENSITY_BINS / (right - left))).astype(np.int64),
+                          0, DENSITY_BINS - 1)
+        rows = np.clip(((chunk[:, 1] - bottom) * (DENSITY_BINS / (top - bottom))).astype(np.int64),
+                       0, DENSITY_BINS - 1)
+        cells = rows * DENSITY_BINS + columns
+        counts += np.bincount(cells, minlength=DENSITY_BINS ** 2)
+        counts_inside += np.bincount(cells[chunk_inside], minlength=DENSITY_BINS ** 2)
+    counts = counts.reshape(DENSITY_BINS, DENSITY_BINS)
+    counts_inside = counts_inside.reshape(DENSITY_BINS, DENSITY_BINS)
+    with np.errstate(invalid='ignore'):
+        fraction_inside = np.nan_to_num(counts_inside / counts)
+    image = np.zeros((DENSITY_BINS, DENSITY_BINS, 4))
+    image[..., 0] = 1 - fraction_inside
+    image[..., 1] = 0.5 * fraction_inside
+    image[..., 3] = counts / counts.max() if counts.max() > 0 else 0
+    ax.imshow(image, extent=(left, right, bottom, top), origin='lower',
+              interpolation='nearest', aspect='auto', zorder=0)
+
+
+def get_result_limits(domain):
+    left, right, bottom, top = domain
+    return (min(left, 0) - 0.1, max(right, 1) + 0.1), (min(bottom, 0) - 0.1, max(top, 1) + 0.1)
+
+
+def plot_result(fig, ax, figures, coordinates=None, inside=None, domain=UNIT_SQUARE, render=RenderModes.auto):
+    for figure in (figures if isinstance(figures, (list, tuple)) else [figures]):
+        figure.draw(fig, ax)
+    if coordinates is not None:
+        draw_samples(fig, ax, coordinates, inside, render=render, domain=domain)
+
+
+def draw_result(figures, coordinates=None, inside=None, domain=UNIT_SQUARE, filename=None, render=RenderModes.auto):
+    """
+    With filename the result is drawn on a pooled figure, saved and the figure is given back to
+    the pool. Without filename a new figure is returned, the caller owns it.
+    """
+    xlim, ylim = get_result_limits(domain)
+    if not filename:
+        fig, ax = get_fig_base(xlim, ylim)
+        plot_result(fig, ax, figures, coordinates, inside, domain, render)
+        return fig, ax
+
+    with figure_pool.get_figure(xlim, ylim) as (fig, ax):
+        with Span('plot'):
+            plot_result(fig, ax, figures, coordinates, inside, domain, render)
+        with Span('encode'):
+            fig.savefig(os.path.join(directory, filename))
+
+
+def warm_up_rendering():
+    """
+    Imports matplotlib and renders one figure of the pool to PNG, which loads the fonts (building
+    the font cache if there is none) before the first request needs them. The figure stays in the pool.
+    """
+    with figure_pool.get_figure() as (fig, ax):
+        get_png(fig)
+
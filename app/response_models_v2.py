@@ -1,6 +1,12 @@
-from typing import Union
+from typing import List, Union
 from enum import Enum
-from pydantic import BaseModel, constr, conlist, confloat
+from pydantic import BaseModel, constr, conlist, confloat, root_validator, validator
+
+# large convex polygons are handled by the wedge index of the figures in O(log n) per sample
+MAX_POLYGON_VERTICES = 100000
+MAX_BALL_DIMENSION = 20
+# keeps the volume of the bounding cube, (2 r)^d, finite in every dimension
+MAX_BALL_COORDINATE = 1e6
 
 
 class Colors(str, Enum):
@@ -72,6 +78,22 @@ class ItemCircle(BaseModel):
         }
 
 
+class ItemBall(BaseModel):
+    name: Union[str, None] = None
+    center: conlist(confloat(ge=-MAX_BALL_COORDINATE, le=MAX_BALL_COORDINATE),
+                    min_items=1, max_items=MAX_BALL_DIMENSION)
+    radius: confloat(gt=0, le=MAX_BALL_COORDINATE)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "name": "ball_5d",
+                "center": [0.0, 0.0, 0.0, 0.0, 0.0],
+                "radius": 1.0
+            }
+        }
+
+
 class ItemTriangle(BaseModel):
     a: ItemPoint
     b: ItemPoint
@@ -89,7 +111,16 @@ class ItemTriangle(BaseModel):
 
 class ItemPolygon(BaseModel):
     name: Union[str, None] = None
-    vertices: conlist(ItemPoint, min_items=3, max_items=7, unique_items=True)
+    vertices: conlist(ItemPoint, min_items=3, max_items=MAX_POLYGON_VERTICES)
+    # vertices are in boundary order, otherwise they are sorted by angle
+    keep_order: bool = False
+
+    @validator('vertices')
+    def check_unique_vertices(cls, vertices):
+        # unique_items of conlist compares every pair of items, which is too slow for large polygons
+        if len({(vertex.name, vertex.x, vertex.y) for vertex in vertices}) != len(vertices):
+            raise ValueError("the list has duplicated items")
+        return vertices
 
     class Config:
         schema_extra = {
@@ -121,6 +152,54 @@ class ItemPolygon(BaseModel):
         }
 
 
+class Engines(str, Enum):
+    exact = "exact"
+    monte_carlo = "monte_carlo"
+    both = "both"
+
+
+class StreamFormats(str, Enum):
+    ndjson = "ndjson"
+    sse = "sse"
+
+
+class ItemFigure(BaseModel):
+    name: Union[str, None] = None
+    circle: Union[ItemCircle, None] = None
+    polygon: Union[ItemPolygon, None] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_single_figure(cls, values):
+        if (values.get('circle') is None) == (values.get('polygon') is None):
+            raise ValueError("Exactly one of circle and polygon must be given")
+        return values
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "name": "my_circle",
+                "circle": {
+                    "center": {"name": '0', 'x': 0.5, 'y': 0.5},
+                    "radius": 0.25
+                }
+            }
+        }
+
+
+class ItemAreaBatch(BaseModel):
+    figures: conlist(ItemFigure, min_items=1, max_items=100)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "figures": [
+                    {"name": "small", "circle": {"center": {"name": '0', 'x': 0.5, 'y': 0.5}, "radius": 0.25}},
+                    {"name": "large", "circle": {"center": {"name": '0', 'x': 0.5, 'y': 0.5}, "radius": 0.26}}
+                ]
+            }
+        }
+
+
 class SuccessfulResponse(BaseModel):
     message: constr(min_length=2, max_length=30) = 'Example success response'
 
@@ -129,13 +208,74 @@ class AreaResponse(BaseModel):
     figure: str
     area: float
     time: float
+    engine: Union[Engines, None] = None
+    exact_area: Union[float, None] = None
+    error: Union[float, None] = None
+    relative_error: Union[float, None] = None
+    cached: Union[bool, None] = None
+    peak_memory_mb: Union[float, None] = None
+    standard_error: Union[float, None] = None
+    confidence_interval: Union[conlist(float, min_items=2, max_items=2), None] = None
+    confidence: Union[float, None] = None
+    number_of_points: Union[int, None] = None
+    seed: Union[int, None] = None
+    # low and high border of every axis, (left, right, bottom, top) in 2-D
+    sampling_box: Union[conlist(float, min_items=2, max_items=2 * MAX_BALL_DIMENSION), None] = None
+    sampler: Union[str, None] = None
+    dtype: Union[str, None] = None
+    image: Union[str, None] = None
 
     class Config:
         schema_extra = {
             "example": {
                 "figure": "poly",
                 "area": 0.81,
-                "time": 0.25
+                "time": 0.25,
+                "engine": "both",
+                "exact_area": 0.8,
+                "error": 0.01,
+                "relative_error": 0.0125,
+                "cached": False,
+                "peak_memory_mb": 1.53,
+                "standard_error": 0.0039,
+                "confidence_interval": [0.8021, 0.8174],
+                "confidence": 0.95,
+                "number_of_points": 10000,
+                "seed": 2023,
+                "sampling_box": [0.1, 0.9, 0.1, 0.9],
+                "sampler": "random",
+                "dtype": "float64"
+            }
+        }
+
+
+class BatchAreaResponse(BaseModel):
+    results: List[AreaResponse]
+    time: float
+    peak_memory_mb: Union[float, None] = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    progress: float
+    result: Union[AreaResponse, None] = None
+    error: Union[str, None] = None
+    created_at: float
+    started_at: Union[float, None] = None
+    finished_at: Union[float, None] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": "0f8e1b7cf4c94d3c9a5a5e3e1f0d7f41",
+                "status": "running",
+                "progress": 0.35,
+                "result": None,
+                "error": None,
+                "created_at": 1676900000.0,
+                "started_at": 1676900000.5,
+                "finished_at": None
             }
         }
 
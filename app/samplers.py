@@ -0,0 +1,166 @@
+from enum import Enum
+import numpy as np
+
+SOBOL_BITS = 32
+HALTON_BASES = (2, 3)
+
+
+def get_seed_sequence(seed):
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+class Samplers(str, Enum):
+    random = "random"
+    halton = "halton"
+    halton_scrambled = "halton_scrambled"
+    sobol = "sobol"
+    sobol_scrambled = "sobol_scrambled"
+
+
+class Dtypes(str, Enum):
+    float32 = "float32"
+    float64 = "float64"
+
+
+class Sampler:
+    """
+    Generates points in the unit square. Every chunk of the Monte Carlo run asks for the points
+    with indices start, ..., start + size - 1 and passes its own seed sequence, so the points do
+    not depend on how the chunks are distributed over workers. The returned array is not used
+    by the sampler afterwards and may be modified in place.
+    Points are returned in the precision of dtype. float32 halves the memory traffic of sampling
+    and containment; the random sampler then draws other numbers for the same seed.
+    """
+
+    def __init__(self, seed_sequence):
+        raise NotImplementedError("Subclasses should implement this!")
+
+    def sample(self, seed_sequence, start, size):
+        raise NotImplementedError("Subclasses should implement this!")
+
+
+class RandomSampler(Sampler):
+    """
+    Uniform points in the unit cube of any dimension, the unit square by default.
+    """
+
+    def __init__(self, seed_sequence=None, dimension=2, dtype=Dtypes.float64):
+        self.dimension = dimension
+        self.dtype = np.dtype(Dtypes(dtype).value)
+
+    def sample(self, seed_sequence, start, size):
+        return np.random.default_rng(seed_sequence).random((size, self.dimension), dtype=self.dtype)
+
+
+class HaltonSampler(Sampler):
+    """
+    Halton sequence in bases 2 and 3. The scrambled variant applies a random permutation of
+    the digits at every digit position (drawn once per request), which keeps the low discrepancy
+    of the sequence while making each request an independent randomized estimate.
+    """
+
+    def __init__(self, seed_sequence=None, scramble=False, dtype=Dtypes.float64):
+        self.scramble = scramble
+        self.dtype = np.dtype(Dtypes(dtype).value)
+        self.permutations = None
+        if scramble:
+            rng = np.random.default_rng(get_seed_sequence(seed_sequence).generate_state(4))
+            self.permutations = [np.array([rng.permutation(base) for _ in range(self.get_number_of_digits(base))])
+                                 for base in HALTON_BASES]
+
+    @staticmethod
+    def get_number_of_digits(base):
+        return int(np.ceil(53 * np.log(2) / np.log(base)))
+
+    def radical_inverse(self, indices, base, permutations=None):
+        result = np.zeros(len(indices))
+        remaining = indices.copy()
+        factor = 1 / base
+        for position in range(self.get_number_of_digits(base)):
+            if permutations is None and not remaining.any():
+                break
+            digits = remaining % base
+            if permutations is not None:
+                digits = permutations[position][digits]
+            result += digits * factor
+            remaining //= base
+            factor /= base
+        return result
+
+    def sample(self, seed_sequence, start, size):
+        indices = np.arange(start + 1, start + size + 1, dtype=np.int64)
+        permutations = self.permutations or [None] * len(HALTON_BASES)
+        points = np.column_stack([self.radical_inverse(indices, base, base_permutations)
+                                  for base, base_permutations in zip(HALTON_BASES, permutations)])
+        return points.astype(self.dtype, copy=False)
+
+
+class SobolSampler(Sampler):
+    """
+    Two dimensional Sobol sequence (direction numbers of the first two Joe-Kuo dimensions),
+    generated in Gray code order. The scrambled variant applies a random linear matrix scramble
+    and a random digital shift, drawn once per request.
+    """
+
+    def __init__(self, seed_sequence=None, scramble=False, dtype=Dtypes.float64):
+        self.scramble = scramble
+        self.dtype = np.dtype(Dtypes(dtype).value)
+        self.direction_numbers = self.get_direction_numbers()
+        self.shift = np.zeros(2, dtype=np.uint64)
+        if scramble:
+            rng = np.random.default_rng(get_seed_sequence(seed_sequence).generate_state(4))
+            self.direction_numbers = np.array([self.linear_matrix_scramble(numbers, rng)
+                                               for numbers in self.direction_numbers], dtype=np.uint64)
+            self.shift = rng.integers(0, 2 ** SOBOL_BITS, size=2, dtype=np.uint64)
+
+    @staticmethod
+    def get_direction_numbers():
+        first = [1 << (SOBOL_BITS - 1 - k) for k in range(SOBOL_BITS)]
+        second = [1 << (SOBOL_BITS - 1)]
+        for _ in range(1, SOBOL_BITS):
+            second.append(second[-1] ^ (second[-1] >> 1))
+        return np.array([first, second], dtype=np.uint64)
+
+    @staticmethod
+    def linear_matrix_scramble(numbers, rng):
+        """
+        Multiplies every direction number by a random lower triangular binary matrix with unit
+        diagonal, rows and columns ordered from the most significant bit.
+        """
+        rows = []
+        for row in range(SOBOL_BITS):
+            bits = rng.integers(0, 2, size=row)
+            mask = sum(int(bit) << (SOBOL_BITS - 1 - column) for column, bit in enumerate(bits))
+            rows.append(mask | (1 << (SOBOL_BITS - 1 - row)))
+        scrambled = []
+        for number in numbers:
+            number = int(number)
+            scrambled.append(sum((bin(number & mask).count('1') & 1) << (SOBOL_BITS - 1 - row)
+                                 for row, mask in enumerate(rows)))
+        return scrambled
+
+    def sample(self, seed_sequence, start, size):
+        if start + size > 2 ** SOBOL_BITS:
+            raise ValueError(f"Sobol sampler supports at most 2**{SOBOL_BITS} points")
+        indices = np.arange(start, start + size, dtype=np.uint64)
+        gray_code = indices ^ (indices >> np.uint64(1))
+        points = np.empty((size, 2), dtype=self.dtype)
+        for dimension in range(2):
+            values = np.zeros(size, dtype=np.uint64)
+            for bit in range(int(gray_code.max()).bit_length() if size else 0):
+                has_bit = ((gray_code >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+                values[has_bit] ^= self.direction_numbers[dimension, bit]
+            points[:, dimension] = (values ^ self.shift[dimension]) / 2 ** SOBOL_BITS
+        return points
+
+
+def get_sampler(name, seed_sequence=None, dimension=2, dtype=Dtypes.float64):
+    name = Samplers(name)
+    if name == Samplers.random:
+        return RandomSampler(seed_sequence, dimension, dtype)
+    if dimension != 2:
+        raise ValueError(f"Sampler {name.value} only generates 2-D points, use {Samplers.random.value} "
+                         f"for {dimension} dimensions")
+    if name in (Samplers.halton, Samplers.halton_scrambled):
+        return HaltonSampler(seed_sequence, scramble=name == Samplers.halton_scrambled, dtype=dtype)
+    return SobolSampler(seed_sequence, scramble=name == Samplers.sobol_scrambled, dtype=dtype)
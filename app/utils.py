@@ -1,39 +1,452 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-from app.figures import Point
-
-directory = 'figures'
-
-
-def get_fig_base():
-    fig = plt.figure(figsize=(8,8))
-    ax = fig.add_subplot(1, 1, 1)
-    ax.grid(color='gray', alpha=0.4)
-    ax.set_xlim(-0.1, 1.1)
-    ax.set_ylim(-0.1, 1.1)
-    ax.set_xlabel('x')
-    ax.set_ylabel('y')
-    return fig, ax
-
-
-def calculate_area_monte_carlo(figure, number_of_points, draw_final_result=False, filename=None):
-    
-    coordinates = np.random.uniform(size=(number_of_points, 2))
-    points = [Point('', x, y) for i, (x, y) in enumerate(coordinates)]
-    points_inside_figure = list(filter(lambda p: figure.is_point_inside(p), points))
-    area = len(points_inside_figure)/number_of_points
-    
-    if draw_final_result or filename:
-        fig, ax = get_fig_base()
-        figure.draw(fig, ax)
-        for p in points:
-            if p in points_inside_figure:
-                p.draw_point(fig, ax, color='green', s=5)
-            else:
-                p.draw_point(fig, ax, color='red', s=5)
-        if filename:
-            path = os.path.join(directory, filename)
-            fig.savefig(path)
-
-    return area
+import multiprocessing
+import threading
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from app.figures import GRID_INDEX_MIN_POINTS, Ball, Circle, Point, Polygon
+from app.metrics import Span
+from app.rendering import UNIT_SQUARE, PackedMask, RenderModes, draw_result
+from app.samplers import Dtypes, Samplers, get_sampler, get_seed_sequence
+
+DEFAULT_CHUNK_SIZE = 2 ** 20
+FIRST_ADAPTIVE_CHUNK_SIZE = 2 ** 12
+MIN_CHUNK_SIZE = 2 ** 10
+MAX_WORKERS = os.cpu_count() or 1
+MEMORY_BUDGET = int(os.environ.get('MONTE_CARLO_MEMORY_BUDGET', 256 * 2 ** 20))
+# upper estimate of the bytes held per 2-D sample while a chunk is generated and classified
+BYTES_PER_SAMPLE = 96
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+class MemoryBudgetExceeded(ValueError):
+    pass
+
+
+class PeakMemoryTracker:
+    """
+    Measures the peak of memory allocated through tracemalloc inside the with block, in bytes.
+    tracemalloc is process wide, so requests running at the same time share the tracer and the
+    reported peak is an upper bound. Memory used by the worker processes is not included.
+    """
+    _lock = threading.Lock()
+    _active = 0
+
+    def __init__(self):
+        self.start = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with PeakMemoryTracker._lock:
+            if PeakMemoryTracker._active == 0:
+                tracemalloc.start()
+                tracemalloc.reset_peak()
+            PeakMemoryTracker._active += 1
+            self.start, _ = tracemalloc.get_traced_memory()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with PeakMemoryTracker._lock:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak = max(peak - self.start, 0)
+            PeakMemoryTracker._active -= 1
+            if PeakMemoryTracker._active == 0:
+                tracemalloc.stop()
+        return False
+
+
+def get_bytes_per_sample(dimension=2, dtype=Dtypes.float64):
+    # the coordinates and the arrays derived from them dominate, so the estimate grows with the dimension
+    # and shrinks with the precision
+    return BYTES_PER_SAMPLE * dimension // 2 * np.dtype(Dtypes(dtype).value).itemsize // 8
+
+
+def get_chunk_size(chunk_size=None, memory_budget=MEMORY_BUDGET, bytes_per_sample=BYTES_PER_SAMPLE):
+    """
+    Chunk size that keeps one chunk in memory within memory_budget bytes. The default chunk size
+    is shrunk to fit; an explicitly requested chunk size that does not fit is rejected.
+    """
+    fitting_chunk_size = memory_budget // bytes_per_sample
+    if chunk_size is None:
+        chunk_size = min(DEFAULT_CHUNK_SIZE, fitting_chunk_size)
+        if chunk_size < MIN_CHUNK_SIZE:
+            raise MemoryBudgetExceeded(f"Memory budget of {memory_budget} bytes is too small")
+    elif chunk_size > fitting_chunk_size:
+        raise MemoryBudgetExceeded(f"Chunks of {chunk_size} points need about {chunk_size * bytes_per_sample} "
+                                   f"bytes, over the memory budget of {memory_budget} bytes")
+    return chunk_size
+
+
+def get_number_of_workers(workers, chunk_size, memory_budget=MEMORY_BUDGET, bytes_per_sample=BYTES_PER_SAMPLE):
+    """
+    Every worker holds one chunk, so the parallelism rather than the chunk layout is reduced to
+    stay within the budget. This keeps results for a given seed independent of the budget check.
+    """
+    return max(1, min(workers, memory_budget // (chunk_size * bytes_per_sample)))
+
+
+class MonteCarloResult:
+
+    def __init__(self, points_inside=0, number_of_points=0, confidence=0.95, seed=None, domain=UNIT_SQUARE,
+                 sampler=Samplers.random, dtype=Dtypes.float64):
+        self.points_inside = points_inside
+        self.number_of_points = number_of_points
+        self.confidence = confidence
+        self.seed = seed
+        self.domain = domain
+        self.domain_area = get_domain_area(domain)
+        self.sampler = Samplers(sampler)
+        self.dtype = Dtypes(dtype)
+
+    def add(self, points_inside, number_of_points):
+        self.points_inside += int(points_inside)
+        self.number_of_points += int(number_of_points)
+
+    @property
+    def fraction_inside(self):
+        return self.points_inside / self.number_of_points if self.number_of_points else 0.0
+
+    @property
+    def area(self):
+        return self.fraction_inside * self.domain_area
+
+    @property
+    def standard_error(self):
+        if not self.number_of_points:
+            return np.inf
+        p = self.fraction_inside
+        return float(self.domain_area * np.sqrt(p * (1 - p) / self.number_of_points))
+
+    def get_confidence_interval(self):
+        """
+        Wilson score interval for the binomial proportion of points inside, scaled by the area
+        of the sampling domain.
+        """
+        if not self.number_of_points:
+            return 0.0, self.domain_area
+        n = self.number_of_points
+        p = self.fraction_inside
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        denominator = 1 + z ** 2 / n
+        center = (p + z ** 2 / (2 * n)) / denominator
+        half_width = z / denominator * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+        lower, upper = max(center - half_width, 0.0), min(center + half_width, 1.0)
+        return float(lower * self.domain_area), float(upper * self.domain_area)
+
+    def is_precise(self, target_standard_error=None, relative_tolerance=None):
+        """
+        The stopping rule uses the half width of the confidence interval, which unlike the plain
+        binomial standard error does not collapse to zero when no point has hit the figure yet.
+        """
+        lower, upper = self.get_confidence_interval()
+        half_width = (upper - lower) / 2
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        if target_standard_error is not None and half_width / z > target_standard_error:
+            return False
+        if relative_tolerance is not None and (self.area == 0 or half_width / self.area > relative_tolerance):
+            return False
+        return True
+
+    def to_dict(self):
+        return {'area': self.area,
+                'standard_error': self.standard_error,
+                'confidence_interval': list(self.get_confidence_interval()),
+                'confidence': self.confidence,
+                'number_of_points': self.number_of_points,
+                'seed': self.seed,
+                'sampling_box': list(self.domain),
+                'sampler': self.sampler.value,
+                'dtype': self.dtype.value}
+
+    def __repr__(self):
+        lower, upper = self.get_confidence_interval()
+        return f"area = {self.area} ({self.confidence:.0%} CI [{lower}, {upper}], n = {self.number_of_points})"
+
+
+def iterate_chunk_sizes(number_of_points, chunk_size=DEFAULT_CHUNK_SIZE, first_chunk_size=None):
+    """
+    Splits number_of_points into chunks of at most chunk_size. With first_chunk_size the chunks
+    start small and double up to chunk_size, so adaptive runs can stop early.
+    """
+    size = min(first_chunk_size or chunk_size, chunk_size)
+    remaining = number_of_points
+    while remaining > 0:
+        yield min(size, remaining)
+        remaining -= size
+        size = min(2 * size, chunk_size)
+
+
+def get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _process_pool
+
+
+def get_domain_area(domain):
+    """
+    Area of (left, right, bottom, top), or volume of a box given by the low and high border of
+    every axis in the same order.
+    """
+    return float(np.prod(np.subtract(domain[1::2], domain[0::2])))
+
+
+def iterate_blocks(number_of_points, chunk_size=DEFAULT_CHUNK_SIZE, first_chunk_size=None, seed=None):
+    """
+    Yields (seed_sequence, start, size) for every chunk, where start is the index of the first
+    point of the chunk. Each chunk draws from its own stream spawned from the request seed, so
+    the samples depend only on seed and chunk layout, never on which worker evaluates them.
+    """
+    seed_sequence = get_seed_sequence(seed)
+    start = 0
+    for size in iterate_chunk_sizes(number_of_points, chunk_size, first_chunk_size):
+        yield seed_sequence.spawn(1)[0], start, size
+        start += size
+
+
+def sample_block(sampler, block, domain=UNIT_SQUARE):
+    # scaled in place and in the precision of the sampler, in high dimensions the points are most
+    # of the memory of a chunk
+    points = sampler.sample(*block)
+    lows, highs = np.asarray(domain[0::2], dtype=points.dtype), np.asarray(domain[1::2], dtype=points.dtype)
+    points *= highs - lows
+    points += lows
+    return points
+
+
+def get_local_frame(figures, domain, dtype):
+    """
+    float32 samples are drawn and classified relative to the low corner of the domain, with the
+    figures moved there in float64, so they are rounded by about 6e-8 of the size of the domain
+    whatever its distance from the origin. Returns (figures, domain, origin), origin is None when
+    the samples are taken as they are.
+    """
+    origin = np.asarray(domain[0::2], dtype=float)
+    if Dtypes(dtype) != Dtypes.float32 or not origin.any():
+        return figures, domain, None
+    local_domain = tuple(border for low, high in zip(domain[0::2], domain[1::2]) for border in (0.0, high - low))
+    return [figure.get_translated(-origin) for figure in figures], local_domain, origin
+
+
+def get_float32_bias_bound(figure, number_of_points, seed=0):
+    """
+    Returns (bias bound, standard error) of a float32 estimate from number_of_points points. The
+    points are classified in float64 and rounded to float32, in the frame of get_local_frame; every
+    sample classified differently moves the estimate by at most one sample.
+    """
+    domain = figure.get_bounding_box()
+    (local_figure,), local_domain, _ = get_local_frame([figure], domain, Dtypes.float32)
+    lows, highs = np.array(local_domain[0::2]), np.array(local_domain[1::2])
+    points = lows + (highs - lows) * np.random.default_rng(seed).random((number_of_points, len(lows)))
+    inside = local_figure.contains_points(points)
+    flipped = np.count_nonzero(inside != local_figure.contains_points(points.astype(np.float32)))
+    domain_area = get_domain_area(domain)
+    p = np.count_nonzero(inside) / number_of_points
+    return flipped / number_of_points * domain_area, domain_area * np.sqrt(p * (1 - p) / number_of_points)
+
+
+def count_block_inside(figures, sampler, block, domain=UNIT_SQUARE):
+    # the spans are only recorded when the block is counted in the process handling the request
+    with Span('sampling'):
+        coordinates = sample_block(sampler, block, domain)
+    with Span('containment'):
+        return [int(np.count_nonzero(figure.contains_points(coordinates))) for figure in figures]
+
+
+def iterate_block_counts(figures, sampler, blocks, workers=1, domain=UNIT_SQUARE):
+    """
+    Yields (size, points_inside) in block order, with points_inside counted for every figure.
+    With several workers the blocks are evaluated on the process pool with at most 2 * workers
+    of them in flight; blocks still pending when the consumer stops early are cancelled.
+    """
+    if workers <= 1:
+        for block in blocks:
+            yield block[-1], count_block_inside(figures, sampler, block, domain)
+        return
+
+    pool = get_process_pool()
+    pending = deque()
+    try:
+        for block in blocks:
+            pending.append((block[-1], pool.submit(count_block_inside, figures, sampler, block, domain)))
+            if len(pending) >= 2 * workers:
+                size, future = pending.popleft()
+                yield size, future.result()
+        while pending:
+            size, future = pending.popleft()
+            yield size, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def get_union_bounding_box(figures):
+    boxes = np.array([figure.get_bounding_box() for figure in figures], dtype=float)
+    union = np.empty(boxes.shape[1])
+    union[0::2], union[1::2] = boxes[:, 0::2].min(axis=0), boxes[:, 1::2].max(axis=0)
+    return tuple(union.tolist())
+
+
+def estimate_areas(figures, number_of_points, chunk_size=None, target_standard_error=None,
+                   relative_tolerance=None, confidence=0.95, seed=None, workers=1, domain=None,
+                   sampler=Samplers.random, memory_budget=MEMORY_BUDGET, progress_callback=None,
+                   filename=None, render=RenderModes.auto, dtype=Dtypes.float64):
+    """
+    Estimates the areas of all figures from one shared cloud of points, drawn by default from the
+    union of their bounding boxes. Every chunk is generated once and tested against each figure,
+    so the sampling cost is paid once, and since the points are shared, differences between the
+    estimated areas have a much lower variance than with independent clouds. Returns one result
+    per figure; adaptive runs stop when all of them are precise enough.
+
+    Parameters are the same as in estimate_area, progress_callback gets the list of results.
+    Figures of other dimensions than 2 (balls) are sampled from a box with the low and high border
+    of every axis, by the random sampler only.
+    """
+    domain = tuple(float(border) for border in (domain or get_union_bounding_box(figures)))
+    if not all(high > low for low, high in zip(domain[0::2], domain[1::2])):
+        raise ValueError(f"Sampling domain {domain} must have positive width and height")
+    dimension = len(domain) // 2
+    if filename:
+        check_drawable(domain)
+    bytes_per_sample = get_bytes_per_sample(dimension, dtype)
+    chunk_size = get_chunk_size(chunk_size, memory_budget, bytes_per_sample)
+    workers = get_number_of_workers(workers, chunk_size, memory_budget, bytes_per_sample)
+    adaptive = target_standard_error is not None or relative_tolerance is not None
+    first_chunk_size = FIRST_ADAPTIVE_CHUNK_SIZE if adaptive else None
+    seed_sequence = np.random.SeedSequence(seed)
+    point_sampler = get_sampler(sampler, seed_sequence, dimension, dtype)
+    blocks = iterate_blocks(number_of_points, chunk_size, first_chunk_size, seed_sequence)
+
+    results = [MonteCarloResult(confidence=confidence, seed=seed_sequence.entropy, domain=domain, sampler=sampler,
+                                dtype=dtype) for _ in figures]
+    local_figures, local_domain, _ = get_local_frame(figures, domain, dtype)
+    for size, points_inside in iterate_block_counts(local_figures, point_sampler, blocks, workers, local_domain):
+        for result, figure_points_inside in zip(results, points_inside):
+            result.add(figure_points_inside, size)
+        if progress_callback is not None:
+            progress_callback(results)
+        if adaptive and all(result.is_precise(target_standard_error, relative_tolerance) for result in results):
+            break
+
+    if filename:
+        draw_estimate(figures, number_of_points, seed_sequence.entropy, domain, chunk_size, adaptive, sampler,
+                      memory_budget, filename, render, dtype)
+
+    return results
+
+
+def check_drawable(domain):
+    # the samples are drawn in the plane, balls of other dimensions can be estimated but not drawn
+    if len(domain) != 4:
+        raise ValueError(f"Only 2-D figures can be drawn, the sampling domain has {len(domain) // 2} dimensions")
+
+
+def draw_estimate(figures, number_of_points, seed, domain, chunk_size=None, adaptive=False, sampler=Samplers.random,
+                  memory_budget=MEMORY_BUDGET, filename=None, render=RenderModes.auto, dtype=Dtypes.float64):
+    """
+    Draws the figures with the first chunk of points of the estimate made with the same parameters,
+    without repeating the estimate. seed is the entropy reported in the result and domain its
+    sampling box. Returns (fig, ax) when no filename is given.
+    """
+    check_drawable(domain)
+    dimension = len(domain) // 2
+    chunk_size = get_chunk_size(chunk_size, memory_budget, get_bytes_per_sample(dimension, dtype))
+    first_chunk_size = FIRST_ADAPTIVE_CHUNK_SIZE if adaptive else None
+    seed_sequence = np.random.SeedSequence(seed)
+    first_block = next(iterate_blocks(number_of_points, chunk_size, first_chunk_size, seed_sequence))
+    local_figures, local_domain, origin = get_local_frame(figures, domain, dtype)
+    coordinates = sample_block(get_sampler(sampler, seed_sequence, dimension, dtype), first_block, local_domain)
+    # the union over all figures of a batch is kept packed, one bit per sample, up to the drawing
+    inside = PackedMask.pack(np.zeros(len(coordinates), dtype=bool))
+    for figure in local_figures:
+        inside |= PackedMask.pack(figure.contains_points(coordinates))
+    if origin is not None:
+        coordinates = coordinates + origin
+    return draw_result(figures, coordinates, inside, domain, filename, render)
+
+
+def estimate_area(figure, number_of_points, chunk_size=None, target_standard_error=None,
+                  relative_tolerance=None, confidence=0.95, seed=None, workers=1, domain=None,
+                  sampler=Samplers.random, memory_budget=MEMORY_BUDGET, progress_callback=None,
+                  filename=None, render=RenderModes.auto, dtype=Dtypes.float64):
+    """
+    Samples are generated and classified in chunks of at most chunk_size points and only
+    the running count of points inside is kept, so peak memory depends on chunk_size, not
+    on number_of_points. With filename the result is saved to the figures directory, only the
+    first chunk is plotted, as a scatter or as a density image depending on render (see
+    draw_samples). draw_estimate returns the same figure to the caller.
+    Without chunk_size the largest default chunk that fits in memory_budget is used, an explicit
+    chunk_size over the budget raises MemoryBudgetExceeded before anything is allocated.
+
+    If target_standard_error or relative_tolerance is given, sampling stops as soon as the
+    confidence interval is tight enough and number_of_points is only the hard cap.
+
+    The same seed and chunk layout give the same area for any number of workers, since
+    chunks are merged in order and the stopping rule is checked after every chunk.
+
+    Points are drawn uniformly from domain = (left, right, bottom, top), by default the figure's
+    bounding box, and the fraction inside is scaled by the domain area. Parts of the figure
+    outside of the domain are not counted.
+
+    sampler selects pseudo-random points or a (scrambled) Halton or Sobol sequence. For the
+    low-discrepancy samplers the reported binomial standard error is a conservative bound;
+    repeated runs of a scrambled sampler with different seeds give an empirical error bar.
+
+    progress_callback is called with the running result after every chunk; an exception raised
+    by it stops the computation.
+
+    dtype is the precision of the samples and of the containment tests. float32 samples are taken
+    relative to the corner of the domain (see get_local_frame) and rounded by about 6e-8 of the
+    domain size, which moves only samples that close to the boundary of the figure, far below the
+    Monte Carlo noise.
+    """
+    report_progress = None
+    if progress_callback is not None:
+        def report_progress(results):
+            progress_callback(results[0])
+    results = estimate_areas([figure], number_of_points, chunk_size=chunk_size,
+                             target_standard_error=target_standard_error, relative_tolerance=relative_tolerance,
+                             confidence=confidence, seed=seed, workers=workers, domain=domain, sampler=sampler,
+                             memory_budget=memory_budget, progress_callback=report_progress,
+                             filename=filename, render=render, dtype=dtype)
+    return results[0]
+
+
+def calculate_area_monte_carlo(figure, number_of_points, draw_final_result=False, filename=None,
+                               chunk_size=None, seed=None, domain=None, sampler=Samplers.random):
+    """
+    Returns the area, with draw_final_result (area, fig, ax), the figure drawn with the first chunk
+    of samples. It is not registered with pyplot, in a notebook show it with display(fig).
+    """
+    if draw_final_result:
+        check_drawable(domain or figure.get_bounding_box())
+    result = estimate_area(figure, number_of_points, chunk_size=chunk_size, seed=seed, domain=domain,
+                           sampler=sampler, filename=filename)
+    if not draw_final_result:
+        return result.area
+    fig, ax = draw_estimate([figure], number_of_points, result.seed, result.domain, chunk_size, sampler=sampler)
+    return result.area, fig, ax
+
+
+def warm_up_estimates(workers=MAX_WORKERS):
+    """
+    Runs small estimates through every sampler and containment kernel, so the first request does
+    not pay for first calls into NumPy and the samplers. With several workers the process pool is
+    started as well and every worker process imports the application before traffic arrives.
+    """
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    square = Polygon([Point('A', 0.2, 0.2), Point('B', 0.8, 0.2), Point('C', 0.8, 0.8), Point('D', 0.2, 0.8)])
+    for sampler in Samplers:
+        for dtype in Dtypes:
+            estimate_areas([circle, square], GRID_INDEX_MIN_POINTS, seed=0, sampler=sampler, dtype=dtype)
+    estimate_area(Ball(np.zeros(3), 1.0), MIN_CHUNK_SIZE, seed=0)
+    if workers > 1:
+        estimate_areas([circle, square], 2 * workers * MIN_CHUNK_SIZE, chunk_size=MIN_CHUNK_SIZE, seed=0,
+                       workers=workers)
+
@@ -0,0 +1,55 @@
+"""
+Compares the float32 and float64 sample pipelines: throughput of estimate_area in samples per
+second, and the bias of float32. Both precisions classify the same points (the float64 points
+rounded to float32); every sample classified differently moves the estimate by at most one
+sample, so their fraction bounds the bias, which is compared with the standard error of an
+estimate from the same number of points. Run from the repository root:
+
+    python -m benchmarks.compare_dtypes --number-of-points 8388608
+"""
+import argparse
+import time
+import numpy as np
+
+from app.figures import Point, Circle, Polygon, Ball
+from app.samplers import Dtypes
+from app.utils import estimate_area, get_float32_bias_bound
+from benchmarks.micro import get_regular_polygon, get_flower_polygon
+
+
+def get_figures():
+    return {'circle': Circle(Point('O', 0.5, 0.5), 0.3),
+            'triangle': Polygon([Point('A', 0.1, 0.1), Point('B', 0.9, 0.1), Point('C', 0.5, 0.9)]),
+            'convex polygon (1e3 vertices)': get_regular_polygon(1000),
+            'concave polygon (1e3 vertices)': get_flower_polygon(1000),
+            'ball (10 dimensions)': Ball(np.zeros(10), 1.0)}
+
+
+def get_throughput(figure, number_of_points, dtype, repeats):
+    estimate_area(figure, number_of_points // 8, seed=0, dtype=dtype)
+    best = np.inf
+    for seed in range(repeats):
+        start_time = time.perf_counter()
+        estimate_area(figure, number_of_points, seed=seed, dtype=dtype)
+        best = min(best, time.perf_counter() - start_time)
+    return number_of_points / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number-of-points', type=int, default=2 ** 23, help='points per estimate')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per figure and dtype, the best one is kept')
+    args = parser.parse_args()
+
+    print("| figure | float64 [samples/s] | float32 [samples/s] | speedup | bias bound | standard error |")
+    print("|---|---|---|---|---|---|")
+    for name, figure in get_figures().items():
+        float64 = get_throughput(figure, args.number_of_points, Dtypes.float64, args.repeats)
+        float32 = get_throughput(figure, args.number_of_points, Dtypes.float32, args.repeats)
+        bias, standard_error = get_float32_bias_bound(figure, min(args.number_of_points, 2 ** 22))
+        print(f"| {name} | {float64:.3g} | {float32:.3g} | {float32 / float64:.2f}x | {bias:.1e} | "
+              f"{standard_error:.1e} |")
+
+
+if __name__ == '__main__':
+    main()
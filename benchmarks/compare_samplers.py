@@ -0,0 +1,44 @@
+"""
+Compares the root mean square error of the area estimate against the number of points for every
+sampler. Run from the repository root:
+
+    python -m benchmarks.compare_samplers --repeats 20
+"""
+import argparse
+import numpy as np
+
+from app.figures import Point, Circle
+from app.samplers import Samplers
+from app.utils import estimate_area
+
+
+def compare_samplers(figure, exact_area, powers, repeats):
+    errors = {}
+    for sampler in Samplers:
+        errors[sampler.value] = []
+        for power in powers:
+            areas = [estimate_area(figure, 2 ** power, seed=seed, sampler=sampler, domain=(0, 1, 0, 1)).area
+                     for seed in range(repeats)]
+            errors[sampler.value].append(float(np.sqrt(np.mean((np.array(areas) - exact_area) ** 2))))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-power', type=int, default=8, help='smallest N as a power of two')
+    parser.add_argument('--max-power', type=int, default=20, help='largest N as a power of two')
+    parser.add_argument('--repeats', type=int, default=20, help='number of seeds per sampler and N')
+    args = parser.parse_args()
+
+    circle = Circle(Point('O', 0.5, 0.5), 0.3)
+    powers = range(args.min_power, args.max_power + 1, 2)
+    errors = compare_samplers(circle, circle.get_area(), powers, args.repeats)
+
+    print("| N | " + " | ".join(errors) + " |")
+    print("|---" * (len(errors) + 1) + "|")
+    for i, power in enumerate(powers):
+        print(f"| 2^{power} | " + " | ".join(f"{errors[name][i]:.2e}" for name in errors) + " |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Micro-benchmarks of the geometry and Monte Carlo hot paths. Every case is timed over a grid of
+sizes: the number of points N from 1e3 to 1e7, or the number of polygon vertices from 3 to 1e4
+(10 to 1e5 for concave polygons).
+Larger sizes of a case are skipped once a single run, scaled linearly to the next size, would
+take longer than --max-seconds.
+Run from the repository root:
+
+    python -m benchmarks.micro --save benchmarks/baselines/micro.json
+    python -m benchmarks.micro --baseline benchmarks/baselines/micro.json --threshold 0.25
+
+With --baseline the run fails (exit code 1) when any case is slower than its baseline by more
+than the threshold. Baselines are machine specific, save a new one before comparing on another
+machine.
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import numpy as np
+
+from app.figures import Point, Line, Polygon, Circle
+from app.utils import calculate_area_monte_carlo
+
+NUMBERS_OF_POINTS = [10 ** power for power in range(3, 8)]
+NUMBERS_OF_VERTICES = [3, 10, 100, 1000, 10000]
+CONCAVE_NUMBERS_OF_VERTICES = [10, 1000, 100000]
+# number of points tested in the per-point polygon cases
+POLYGON_TEST_POINTS = 100
+# slowdowns smaller than this are timer noise, not regressions
+MIN_REGRESSION_SECONDS = 1e-3
+
+
+def get_coordinates(size, seed=0):
+    return np.random.default_rng(seed).random((size, 2)).tolist()
+
+
+def get_regular_polygon(number_of_vertices):
+    phi = np.linspace(0, 2 * np.pi, number_of_vertices, endpoint=False)
+    return Polygon([Point(f"p{i}", 0.5 + 0.4 * np.cos(angle), 0.5 + 0.4 * np.sin(angle))
+                    for i, angle in enumerate(phi)])
+
+
+def get_flower_polygon(number_of_vertices):
+    # concave, with few edges over every vertical line, given in boundary order
+    phi = np.linspace(0, 2 * np.pi, number_of_vertices, endpoint=False)
+    radius = 0.3 + 0.1 * np.cos(5 * phi)
+    return Polygon([Point(f"p{i}", 0.5 + r * np.cos(angle), 0.5 + r * np.sin(angle))
+                    for i, (angle, r) in enumerate(zip(phi, radius))], keep_order=True)
+
+
+def setup_point_construction(size):
+    coordinates = get_coordinates(size)
+    return lambda: [Point('', x, y) for x, y in coordinates]
+
+
+def setup_line_from_points(size):
+    points = [Point('', x, y) for x, y in get_coordinates(size + 1)]
+    return lambda: [Line.create_line_from_points(p, q) for p, q in zip(points[:-1], points[1:])]
+
+
+def setup_line_crossing_point(size):
+    points = [Point('', x, y) for x, y in get_coordinates(size + 1)]
+    lines = [Line.create_line_from_points(p, q) for p, q in zip(points[:-1], points[1:])]
+    return lambda: [line.get_crossing_point(other) for line, other in zip(lines[:-1], lines[1:])]
+
+
+def setup_circle_is_point_inside(size):
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    points = [Point('', x, y) for x, y in get_coordinates(size)]
+    return lambda: [circle.is_point_inside(p) for p in points]
+
+
+def setup_polygon_is_point_inside(number_of_vertices):
+    polygon = get_regular_polygon(number_of_vertices)
+    points = [Point('', x, y) for x, y in get_coordinates(POLYGON_TEST_POINTS)]
+    return lambda: [polygon.is_point_inside(p) for p in points]
+
+
+def setup_polygon_is_convex(number_of_vertices):
+    polygon = get_regular_polygon(number_of_vertices)
+    return polygon.is_convex
+
+
+def setup_polygon_contains(number_of_vertices):
+    polygon = get_regular_polygon(number_of_vertices)
+    xs, ys = np.random.default_rng(0).random((2, 10 ** 5))
+    return lambda: polygon.contains(xs, ys)
+
+
+def setup_polygon_contains_concave(number_of_vertices):
+    polygon = get_flower_polygon(number_of_vertices)
+    xs, ys = np.random.default_rng(0).random((2, 10 ** 5))
+    return lambda: polygon.contains(xs, ys)
+
+
+def setup_calculate_area_monte_carlo(size):
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    return lambda: calculate_area_monte_carlo(circle, size)
+
+
+# name: (setup returning the function to time, sizes, what the size counts)
+CASES = {
+    'point_construction': (setup_point_construction, NUMBERS_OF_POINTS, 'points'),
+    'line_from_points': (setup_line_from_points, NUMBERS_OF_POINTS, 'points'),
+    'line_crossing_point': (setup_line_crossing_point, NUMBERS_OF_POINTS, 'points'),
+    'circle_is_point_inside': (setup_circle_is_point_inside, NUMBERS_OF_POINTS, 'points'),
+    'polygon_is_point_inside': (setup_polygon_is_point_inside, NUMBERS_OF_VERTICES, 'vertices'),
+    'polygon_is_convex': (setup_polygon_is_convex, NUMBERS_OF_VERTICES, 'vertices'),
+    'polygon_contains': (setup_polygon_contains, NUMBERS_OF_VERTICES, 'vertices'),
+    'polygon_contains_concave': (setup_polygon_contains_concave, CONCAVE_NUMBERS_OF_VERTICES, 'vertices'),
+    'calculate_area_monte_carlo': (setup_calculate_area_monte_carlo, NUMBERS_OF_POINTS, 'points'),
+}
+
+
+def time_function(function, repeats, max_seconds):
+    """
+    Returns the run times in seconds. Repeats stop early once their total exceeds max_seconds,
+    at least one run is always made.
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+        if sum(times) > max_seconds:
+            break
+    return times
+
+
+def run_benchmarks(cases, repeats=5, max_seconds=2.0):
+    results = {}
+    for name in cases:
+        setup, sizes, unit = CASES[name]
+        for size, next_size in zip(sizes, sizes[1:] + [None]):
+            times = time_function(setup(size), repeats, max_seconds)
+            results[f"{name}[{size}]"] = {'case': name, 'size': size, 'unit': unit, 'repeats': len(times),
+                                          'min': min(times), 'median': float(np.median(times))}
+            if next_size and min(times) * next_size / size > max_seconds:
+                break
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Cases present in both runs whose best time is slower than the baseline by more than threshold
+    and by at least MIN_REGRESSION_SECONDS, as a list of (key, baseline seconds, current seconds).
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        reference = baseline[key]['min']
+        if result['min'] > reference * (1 + threshold) and result['min'] - reference >= MIN_REGRESSION_SECONDS:
+            regressions.append((key, reference, result['min']))
+    return regressions
+
+
+def get_metadata():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'date': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES), help='cases to run')
+    parser.add_argument('--repeats', type=int, default=5, help='runs per case and size, the best one is kept')
+    parser.add_argument('--max-seconds', type=float, default=2.0,
+                        help='time limit of the repeats of one size, sizes expected to run longer are skipped')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 means 25%%')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.cases, args.repeats, args.max_seconds)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+
+    print("| case | size | best [s] | median [s] | baseline [s] | change |")
+    print("|---|---|---|---|---|---|")
+    for key, result in results.items():
+        reference = baseline.get(key, {}).get('min')
+        change = f"{result['min'] / reference - 1:+.0%}" if reference else ""
+        print(f"| {result['case']} | {result['size']} {result['unit']} | {result['min']:.3g} | "
+              f"{result['median']:.3g} | {f'{reference:.3g}' if reference else ''} | {change} |")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'metadata': get_metadata(), 'results': results}, file, indent=2)
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for key, reference, current in regressions:
+        print(f"REGRESSION {key}: {reference:.3g} s -> {current:.3g} s")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Sends render requests to the app in a loop and reports the resident memory of the process, which
+should stay flat once the figure pool is warm. Run from the repository root:
+
+    python -m benchmarks.render_soak --requests 10000
+"""
+import argparse
+import resource
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main_v2 import app
+
+
+def get_rss_mb():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def soak(client, requests, report_every):
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    line = {"starting_point": {"name": "A", "x": 0.1, "y": 0.2}, "ending_point": {"name": "B", "x": 0.8, "y": 0.9}}
+    points = [{"name": "A", "x": 0.1, "y": 0.2, "color": "red", "size": 20}]
+    rows = []
+    start_time = time.perf_counter()
+    for i in range(1, requests + 1):
+        if i % 3 == 0:
+            response = client.post("/create_circle", json=circle)
+        elif i % 3 == 1:
+            response = client.post("/create_line", json=line)
+        else:
+            response = client.post("/create_points", json=points)
+        response.raise_for_status()
+        if i % report_every == 0:
+            rows.append((i, get_rss_mb(), (time.perf_counter() - start_time) / i * 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=10000, help='number of render requests')
+    parser.add_argument('--report-every', type=int, default=1000, help='requests between RSS reports')
+    args = parser.parse_args()
+
+    # one client for the whole run, a TestClient used outside of a with block leaks an event loop per request
+    with TestClient(app) as client:
+        rows = soak(client, args.requests, args.report_every)
+    print("| requests | RSS [MB] | mean time per request [ms] |")
+    print("|---|---|---|")
+    for requests, rss, mean_time in rows:
+        print(f"| {requests} | {rss:.1f} | {mean_time:.1f} |")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures the cold start of the application in fresh processes: the time to import the compute
+modules (what every worker process pays) and the web app, and the latency of the first area and
+the first rendering request after startup, with and without the WARM_UP startup hook. With
+--cold-font-cache matplotlib gets an empty configuration directory, like a new container, so the
+font cache has to be built. Run from the repository root:
+
+    python -m benchmarks.startup --repeats 5 --cold-font-cache
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+
+IMPORT_SCRIPT = """
+import sys, time
+start_time = time.perf_counter()
+import {module}
+print(time.perf_counter() - start_time, 'matplotlib' in sys.modules)
+"""
+
+REQUEST_SCRIPT = """
+import json, time
+start_time = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main_v2 import app
+import_seconds = time.perf_counter() - start_time
+circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+with TestClient(app) as client:
+    startup_seconds = time.perf_counter() - start_time - import_seconds
+    start_time = time.perf_counter()
+    client.post("/calculate_area_circle?number_of_points=100000&seed=1", json=circle)
+    area_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    client.post("/create_circle", json=circle)
+    render_seconds = time.perf_counter() - start_time
+print(json.dumps({'import': import_seconds, 'startup': startup_seconds, 'first area request': area_seconds,
+                  'first render request': render_seconds}))
+"""
+
+
+def run_python(script, environment):
+    output = subprocess.run([sys.executable, '-c', script], env=environment, check=True, capture_output=True,
+                            text=True).stdout
+    return output.strip().splitlines()[-1]
+
+
+def get_environment(cold_font_cache, **variables):
+    environment = {**os.environ, **variables}
+    if cold_font_cache:
+        environment['MPLCONFIGDIR'] = tempfile.mkdtemp()
+    return environment
+
+
+def measure_imports(modules, repeats, cold_font_cache):
+    results = {}
+    for module in modules:
+        runs = [run_python(IMPORT_SCRIPT.format(module=module), get_environment(cold_font_cache)).split()
+                for _ in range(repeats)]
+        results[module] = (float(np.median([float(seconds) for seconds, _ in runs])), runs[0][1] == 'True')
+    return results
+
+
+def measure_requests(repeats, cold_font_cache, warm_up):
+    runs = [json.loads(run_python(REQUEST_SCRIPT, get_environment(cold_font_cache, WARM_UP=warm_up)))
+            for _ in range(repeats)]
+    return {name: float(np.median([run[name] for run in runs])) for name in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='fresh processes per measurement, the median is kept')
+    parser.add_argument('--cold-font-cache', action='store_true', help='start every process without a font cache')
+    args = parser.parse_args()
+
+    print("| module | import [s] | imports matplotlib |")
+    print("|---|---|---|")
+    modules = ['app.figures', 'app.utils', 'app.main_v2']
+    for module, (seconds, matplotlib) in measure_imports(modules, args.repeats, args.cold_font_cache).items():
+        print(f"| {module} | {seconds:.3f} | {'yes' if matplotlib else 'no'} |")
+
+    print()
+    results = {warm_up: measure_requests(args.repeats, args.cold_font_cache, warm_up) for warm_up in ('0', '1')}
+    print("| WARM_UP | " + " | ".join(f"{name} [s]" for name in results['0']) + " |")
+    print("|---" * (len(results['0']) + 1) + "|")
+    for warm_up, timings in results.items():
+        print(f"| {warm_up} | " + " | ".join(f"{seconds:.3f}" for seconds in timings.values()) + " |")
+
+
+if __name__ == '__main__':
+    main()
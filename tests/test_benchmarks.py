@@ -0,0 +1,12 @@
+from benchmarks.micro import find_regressions, run_benchmarks
+
+
+def test_find_regressions():
+    baseline = {'a[10]': {'min': 0.1}, 'b[10]': {'min': 0.1}, 'c[10]': {'min': 1e-5}}
+    results = {'a[10]': {'min': 0.2}, 'b[10]': {'min': 0.11}, 'c[10]': {'min': 1e-4}, 'd[10]': {'min': 1.0}}
+    assert find_regressions(results, baseline, threshold=0.25) == [('a[10]', 0.1, 0.2)]
+
+
+def test_run_benchmarks_skips_slow_sizes():
+    results = run_benchmarks(['polygon_is_convex'], repeats=1, max_seconds=1e-9)
+    assert list(results) == ['polygon_is_convex[3]']
@@ -0,0 +1,128 @@
+import threading
+import time
+import pytest
+from app.cache import ResultCache
+from app.figures import Point, Polygon
+from app.jobs import JobCancelled
+from app.main_v2 import StreamClosed
+
+
+def test_cache_hits_and_eviction():
+    cache = ResultCache(max_size=2, ttl=60)
+    assert cache.get_or_compute('a', lambda: 1) == (1, False)
+    assert cache.get_or_compute('a', lambda: 2) == (1, True)
+    cache.get_or_compute('b', lambda: 3)
+    cache.get_or_compute('c', lambda: 4)
+    assert cache.get_or_compute('a', lambda: 5) == (5, False)
+    stats = cache.get_stats()
+    assert (stats['size'], stats['hits'], stats['misses']) == (2, 1, 4)
+
+
+def test_cache_expires_entries():
+    cache = ResultCache(ttl=0)
+    cache.get_or_compute('a', lambda: 1)
+    assert cache.get_or_compute('a', lambda: 2) == (2, False)
+
+
+def test_cache_deduplicates_requests_in_flight():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [(42, False)] + [(42, True)] * 4
+    assert cache.get_stats()['deduplicated'] == 4
+
+
+def test_cache_without_store():
+    cache = ResultCache()
+    assert cache.get_or_compute('a', lambda: 1, store=False) == (1, False)
+    assert cache.get_or_compute('a', lambda: 2, store=False) == (2, False)
+    assert cache.get_stats()['size'] == 0
+
+
+def test_cache_does_not_store_errors():
+    cache = ResultCache()
+    with pytest.raises(ZeroDivisionError):
+        cache.get_or_compute('a', lambda: 1 / 0)
+    assert cache.get_or_compute('a', lambda: 1) == (1, False)
+
+
+@pytest.mark.parametrize('cancellation', [JobCancelled, StreamClosed])
+def test_cache_waiter_computes_when_owner_is_cancelled(cancellation):
+    cache = ResultCache()
+    started = threading.Event()
+    cancel = threading.Event()
+
+    def cancelled_compute():
+        started.set()
+        cancel.wait(5)
+        raise cancellation("cancelled")
+
+    owner_errors = []
+    waiter_results = []
+
+    def run_owner():
+        try:
+            cache.get_or_compute('key', cancelled_compute)
+        except cancellation as error:
+            owner_errors.append(error)
+
+    owner = threading.Thread(target=run_owner)
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: waiter_results.append(cache.get_or_compute('key', lambda: 42)))
+    waiter.start()
+    while cache.get_stats()['deduplicated'] == 0:
+        time.sleep(0.01)
+    cancel.set()
+    owner.join()
+    waiter.join()
+    assert len(owner_errors) == 1
+    assert waiter_results == [(42, False)]
+    assert cache.get_stats()['in_flight'] == 0
+
+
+def test_cache_waiter_gets_progress_and_stops_on_its_own_cancellation():
+    cache = ResultCache()
+    release = threading.Event()
+
+    def compute():
+        cache.publish_progress('key', 0.5)
+        release.wait(5)
+        return 42
+
+    owner_results = []
+    owner = threading.Thread(target=lambda: owner_results.append(cache.get_or_compute('key', compute)))
+    owner.start()
+    while cache.get_stats()['in_flight'] == 0:
+        time.sleep(0.01)
+    progress = []
+
+    def check_cancelled():
+        if progress:
+            raise JobCancelled("cancelled")
+
+    with pytest.raises(JobCancelled):
+        cache.get_or_compute('key', lambda: 0, progress.append, check_cancelled)
+    assert progress == [0.5]
+    release.set()
+    owner.join()
+    assert owner_results == [(42, False)]
+
+
+def test_canonical_key_ignores_names_and_order():
+    first = Polygon([Point('A', 0, 0), Point('B', 0.5, 0), Point('C', 0, 0.5)])
+    second = Polygon([Point('X', 0.5, 0.0000000000001), Point('Y', 0, 0.5), Point('Z', 0, 0)])
+    assert first.get_canonical_key() == second.get_canonical_key()
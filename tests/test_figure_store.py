@@ -0,0 +1,58 @@
+import os
+from app.figure_store import FigureStore, get_validators, is_not_modified
+
+
+def write_png(size):
+    def render(path):
+        with open(path, 'wb') as file:
+            file.write(b'\x89PNG' + bytes(size))
+    return render
+
+
+def test_least_recently_used_figures_are_evicted(tmp_path):
+    store = FigureStore(tmp_path, max_bytes=250)
+    assert store.get_or_render('a', write_png(96))[1]
+    store.get_or_render('b', write_png(96))
+    assert store.get_or_render('a', write_png(96)) == (os.path.join(tmp_path, 'a.png'), False)
+    store.get_or_render('c', write_png(96))
+    assert 'b' not in store and 'a' in store and 'c' in store
+    assert sorted(os.listdir(tmp_path)) == ['a.png', 'c.png']
+    assert store.get_stats()['bytes'] == 200
+
+    reloaded = FigureStore(tmp_path, max_bytes=250)
+    assert reloaded.get_stats()['files'] == 2
+
+
+def test_figure_removed_before_it_is_read_is_rendered_again(tmp_path):
+    store = FigureStore(tmp_path)
+    rendered = []
+
+    def render(path):
+        rendered.append(path)
+        write_png(10)(path)
+
+    get_or_render = store.get_or_render
+
+    def get_or_render_and_delete(key, render):
+        # a concurrent /delete_figure between the lookup and opening the file
+        path, _ = get_or_render(key, render)
+        if len(rendered) == 1:
+            store.delete(key)
+        return path, True
+
+    store.get_or_render = get_or_render_and_delete
+    content, stat = store.read('a', render)
+    assert len(rendered) == 2 and content == b'\x89PNG' + bytes(10) and stat.st_size == len(content)
+    assert store.read('a')[0] == content and store.read('b') is None
+
+
+def test_conditional_requests(tmp_path):
+    path = os.path.join(tmp_path, 'a.png')
+    write_png(10)(path)
+    validators = get_validators(path, 'a')
+    assert validators['ETag'] == '"a"'
+    assert is_not_modified({'if-none-match': '"b", W/"a"'}, validators)
+    assert not is_not_modified({'if-none-match': '"b"', 'if-modified-since': validators['Last-Modified']}, validators)
+    assert is_not_modified({'if-modified-since': validators['Last-Modified']}, validators)
+    assert not is_not_modified({'if-modified-since': 'Thu, 01 Jan 1970 00:00:00 GMT'}, validators)
+    assert not is_not_modified({}, validators)
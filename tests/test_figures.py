@@ -0,0 +1,180 @@
+import math
+import numpy as np
+import pytest
+from app.figures import Point, PointSet, Polygon, Circle, Ball
+from app.indexes import ConvexIndex, EdgesCross, GridIndex, SlabIndex, crossing_number_contains, is_convex
+
+
+def test_polygon_contains_matches_is_point_inside():
+    vertices = [Point('A', 0.1, 0.7), Point('B', 0.5, 0.9), Point('C', 0.9, 0.7), Point('D', 0.5, 0.1)]
+    polygon = Polygon(vertices)
+    coordinates = np.random.default_rng(0).uniform(size=(500, 2))
+    expected = [polygon.is_point_inside(Point('', x, y)) for x, y in coordinates]
+    assert np.array_equal(polygon.contains(coordinates[:, 0], coordinates[:, 1]), expected)
+
+
+def test_polygon_contains_concave():
+    vertices = [Point('A', 0.0, 0.0), Point('B', 1.0, 0.0), Point('C', 1.0, 1.0),
+                Point('D', 0.5, 0.2), Point('E', 0.0, 1.0)]
+    polygon = Polygon(vertices)
+    inside = polygon.contains([0.25, 0.9, 0.9, 0.8], [0.5, 0.5, 0.02, 0.95])
+    assert inside.tolist() == [True, False, True, True]
+
+
+def test_circle_contains_matches_is_point_inside():
+    circle = Circle(Point('O', 0.4, 0.6), 0.3)
+    coordinates = np.random.default_rng(1).uniform(size=(500, 2))
+    expected = [circle.is_point_inside(Point('', x, y)) for x, y in coordinates]
+    assert np.array_equal(circle.contains(coordinates[:, 0], coordinates[:, 1]), expected)
+
+
+def test_grid_index_matches_crossing_number():
+    rng = np.random.default_rng(2)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 200))
+    radii = rng.uniform(0.2, 0.5, 200)
+    vertices_x, vertices_y = 0.5 + radii * np.cos(angles), 0.5 + radii * np.sin(angles)
+    index = GridIndex(vertices_x, vertices_y, resolution=32)
+    assert {0, 1, 2} == set(np.unique(index.cells))
+    coordinates = rng.uniform(size=(100000, 2))
+    expected = crossing_number_contains(vertices_x, vertices_y, coordinates[:, 0], coordinates[:, 1])
+    assert np.array_equal(index.contains(coordinates[:, 0], coordinates[:, 1]), expected)
+
+
+def test_polygon_area():
+    square = Polygon([Point('A', 0, 0), Point('B', 0.5, 0), Point('C', 0, 0.5), Point('D', 0.5, 0.5)])
+    assert np.isclose(square.get_area(), 0.25)
+
+
+def get_regular_polygon_vertices(number_of_vertices, radius=0.4):
+    angles = np.linspace(0, 2 * np.pi, number_of_vertices, endpoint=False)
+    return 0.5 + radius * np.cos(angles), 0.5 + radius * np.sin(angles)
+
+
+def test_convex_index_matches_crossing_number():
+    rng = np.random.default_rng(3)
+    vertices_x, vertices_y = get_regular_polygon_vertices(1000)
+    coordinates = rng.uniform(size=(100000, 2))
+    expected = crossing_number_contains(vertices_x, vertices_y, coordinates[:, 0], coordinates[:, 1])
+    # clockwise vertices are reordered by the index
+    index = ConvexIndex(vertices_x[::-1], vertices_y[::-1])
+    assert np.array_equal(index.contains(coordinates[:, 0], coordinates[:, 1]), expected)
+
+
+def test_is_convex():
+    assert is_convex(*get_regular_polygon_vertices(100))
+    assert is_convex(*get_regular_polygon_vertices(100)[::-1])
+    assert not is_convex(np.array([0.0, 1.0, 1.0, 0.5, 0.0]), np.array([0.0, 0.0, 1.0, 0.2, 1.0]))
+    pentagram = get_regular_polygon_vertices(5)
+    assert not is_convex(pentagram[0][[0, 2, 4, 1, 3]], pentagram[1][[0, 2, 4, 1, 3]])
+
+
+def test_large_convex_polygon_area():
+    vertices_x, vertices_y = get_regular_polygon_vertices(100000)
+    polygon = Polygon([Point(f"p{i}", x, y) for i, (x, y) in enumerate(zip(vertices_x, vertices_y))])
+    coordinates = np.random.default_rng(4).uniform(size=(200000, 2))
+    inside = polygon.contains(coordinates[:, 0], coordinates[:, 1])
+    assert polygon.get_convex_index() is not None
+    assert abs(inside.mean() - polygon.get_area()) < 0.01
+
+
+def get_flower_vertices(number_of_vertices):
+    angles = np.linspace(0, 2 * np.pi, number_of_vertices, endpoint=False)
+    radii = 0.3 + 0.1 * np.cos(5 * angles)
+    return 0.5 + radii * np.cos(angles), 0.5 + radii * np.sin(angles)
+
+
+def test_slab_index_matches_crossing_number():
+    rng = np.random.default_rng(5)
+    coordinates = rng.uniform(size=(100000, 2))
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 300))
+    radii = rng.uniform(0.1, 0.5, 300)
+    star = 0.5 + radii * np.cos(angles), 0.5 + radii * np.sin(angles)
+    # vertical edges and vertices sharing their x coordinate
+    l_shape = np.array([0.1, 0.9, 0.9, 0.5, 0.5, 0.1]), np.array([0.1, 0.1, 0.9, 0.9, 0.5, 0.5])
+    for vertices_x, vertices_y in [get_flower_vertices(1000), star, l_shape]:
+        expected = crossing_number_contains(vertices_x, vertices_y, coordinates[:, 0], coordinates[:, 1])
+        index = SlabIndex(vertices_x, vertices_y)
+        assert np.array_equal(index.contains(coordinates[:, 0], coordinates[:, 1]), expected)
+    with pytest.raises(ValueError):
+        SlabIndex(vertices_x, vertices_y, max_entries=3)
+
+
+def test_slab_index_finds_crossing_edges():
+    rng = np.random.default_rng(8)
+    for _ in range(20):
+        with pytest.raises(EdgesCross):
+            SlabIndex(*rng.uniform(size=(2, 300)))
+    # bowtie, and edges crossing at x = 1 where a vertex starts another slab
+    for vertices_x, vertices_y in [([0.0, 1.0, 1.0, 0.0], [0.0, 1.0, 0.0, 1.0]),
+                                   ([0.0, 2.0, 2.0, 1.0, 0.0], [0.0, 2.0, 0.0, 3.0, 2.0])]:
+        with pytest.raises(EdgesCross):
+            SlabIndex(np.array(vertices_x), np.array(vertices_y))
+    for number_of_vertices in range(3, 200):
+        SlabIndex(*get_flower_vertices(number_of_vertices))
+    points = [Point('', x, y) for x, y in zip(*get_flower_vertices(1000))]
+    assert Polygon(points, keep_order=True).is_simple()
+    polygon = Polygon(points[::2] + points[1::2], keep_order=True)
+    assert polygon.is_simple() is False and polygon.get_slab_index() is None
+
+
+def test_large_concave_polygon_keeps_order():
+    vertices_x, vertices_y = get_flower_vertices(10000)
+    points = [Point(f"p{i}", x, y) for i, (x, y) in enumerate(zip(vertices_x, vertices_y))]
+    polygon = Polygon(points, keep_order=True)
+    assert np.isclose(polygon.get_area(), Polygon(points[::-1], keep_order=True).get_area())
+    coordinates = np.random.default_rng(6).uniform(size=(200000, 2))
+    inside = polygon.contains(coordinates[:, 0], coordinates[:, 1])
+    assert polygon.get_convex_index() is None and polygon.get_slab_index() is not None
+    assert abs(inside.mean() - polygon.get_area()) < 0.01
+
+
+def test_ball_volume_and_containment():
+    assert np.isclose(Ball([0.0], 2.0).get_volume(), 4.0)
+    assert np.isclose(Ball([0.5, 0.5], 0.3).get_volume(), Circle(Point('O', 0.5, 0.5), 0.3).get_area())
+    assert np.isclose(Ball([1.0, 2.0, 3.0], 0.5).get_volume(), 4 / 3 * np.pi * 0.5 ** 3)
+    assert np.isclose(Ball(np.zeros(20), 1.0).get_volume(), np.pi ** 10 / math.factorial(10))
+    ball = Ball([0.4, 0.6], 0.3)
+    coordinates = np.random.default_rng(7).uniform(size=(1000, 2))
+    expected = Circle(Point('O', 0.4, 0.6), 0.3).contains(coordinates[:, 0], coordinates[:, 1])
+    assert np.array_equal(ball.contains_points(coordinates), expected)
+    assert ball.get_bounding_box() == (0.10000000000000003, 0.7, 0.3, 0.8999999999999999)
+
+
+def test_point_computes_polar_coordinates_lazily():
+    point = Point('A', 0.3, 0.4)
+    assert not hasattr(point, '__dict__')
+    assert point._r is None and point._phi is None
+    assert point.r == pytest.approx(0.5)
+    assert point.phi == round(math.degrees(math.asin(0.8)), 2)
+    assert Point('O', 0, 0).phi == 0
+
+
+def test_point_set_matches_points():
+    coordinates = np.random.default_rng(0).uniform(size=(50, 2))
+    points = [Point(f"p{i}", x, y) for i, (x, y) in enumerate(coordinates)]
+    point_set = PointSet.from_points(points)
+    other = Point('Q', 0.2, 0.7)
+    assert np.allclose(point_set.get_distance(other), [p.get_distance(other) for p in points])
+    assert np.allclose(other.get_relative_angle(point_set), [other.get_relative_angle(p) for p in points])
+    assert np.allclose(point_set.r, [p.r for p in points])
+    assert np.array_equal(point_set.phi, [p.phi for p in points])
+    assert point_set[3] == points[3] and point_set[3].name == 'p3'
+    assert points[3] in point_set and other not in point_set
+    assert point_set == PointSet(coordinates[:, 0] + 1e-14, coordinates[:, 1])
+    assert point_set[::2] != point_set[1::2]
+
+
+def test_figures_accept_point_sets():
+    vertices = [Point('A', 0.1, 0.7), Point('B', 0.5, 0.9), Point('C', 0.9, 0.7), Point('D', 0.5, 0.1)]
+    polygon = Polygon(vertices)
+    from_set = Polygon(PointSet.from_points(vertices[::-1]))
+    assert from_set.get_canonical_key() == polygon.get_canonical_key()
+    assert [str(v) for v in from_set.vertices] == [str(v) for v in polygon.vertices]
+    assert from_set.get_perimeter() == polygon.get_perimeter()
+
+    coordinates = np.random.default_rng(0).uniform(size=(200, 2))
+    samples = PointSet(coordinates[:, 0], coordinates[:, 1])
+    circle = Circle(Point('O', 0.5, 0.5), 0.3)
+    for figure in (polygon, circle):
+        assert np.array_equal(figure.is_point_inside(samples), figure.contains_points(coordinates))
+        assert np.array_equal(figure.contains_points(samples), figure.contains_points(coordinates))
@@ -0,0 +1,58 @@
+import threading
+import time
+import pytest
+from app.jobs import JobManager, JobQueueFull, JobStatus
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.is_done() and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_result_and_failure():
+    manager = JobManager(max_workers=1)
+    assert wait_for(manager.submit(lambda job: 42)).result == 42
+    failed = wait_for(manager.submit(lambda job: 1 / 0))
+    assert failed.status == JobStatus.failed and 'division' in failed.error
+
+
+def test_job_queue_limit_and_cancel():
+    manager = JobManager(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+
+    def blocking(job):
+        while not release.wait(0.01):
+            job.check_cancelled()
+        return 'done'
+
+    running = manager.submit(blocking)
+    while running.status != JobStatus.running:
+        time.sleep(0.01)
+    queued = manager.submit(lambda job: 'queued')
+    with pytest.raises(JobQueueFull):
+        manager.submit(lambda job: 'rejected')
+
+    assert manager.cancel(queued.id).status == JobStatus.cancelled
+    manager.cancel(running.id)
+    assert wait_for(running).status == JobStatus.cancelled
+    assert manager.get(running.id).result is None
+
+
+def test_job_cancelled_while_returning():
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def ignores_cancellation(job):
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    job = manager.submit(ignores_cancellation)
+    started.wait(5)
+    manager.cancel(job.id)
+    release.set()
+    assert wait_for(job).status == JobStatus.cancelled
+    assert job.result is None
@@ -0,0 +1,28 @@
+from app.metrics import Histogram, Span, Timings, current_timings
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('duration_seconds', "Duration", 'phase', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'sampling')
+    assert histogram.get_lines()[2:] == ['duration_seconds_bucket{phase="sampling",le="0.1"} 1',
+                                         'duration_seconds_bucket{phase="sampling",le="1.0"} 2',
+                                         'duration_seconds_bucket{phase="sampling",le="+Inf"} 3',
+                                         'duration_seconds_sum{phase="sampling"} 5.55',
+                                         'duration_seconds_count{phase="sampling"} 3']
+
+
+def test_spans_add_up_per_phase():
+    timings = Timings()
+    token = current_timings.set(timings)
+    try:
+        for _ in range(2):
+            with Span('parse') as span:
+                pass
+    finally:
+        current_timings.reset(token)
+    with Span('parse'):
+        pass
+    assert list(timings.durations) == ['parse']
+    assert timings.durations['parse'] >= span.seconds > 0
+    assert timings.get_header().startswith('parse;dur=')
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from app.figures import Point, Circle
+from app.samplers import Samplers, get_sampler
+from app.utils import estimate_area
+
+
+@pytest.mark.parametrize("name", [sampler.value for sampler in Samplers])
+def test_sampler_does_not_depend_on_chunking(name):
+    sampler = get_sampler(name, np.random.SeedSequence(5))
+    whole = sampler.sample(np.random.SeedSequence(1), 0, 1024)
+    assert whole.shape == (1024, 2)
+    assert 0 <= whole.min() and whole.max() < 1
+    if name != Samplers.random:
+        assert np.array_equal(whole[100:300], sampler.sample(np.random.SeedSequence(2), 100, 200))
+
+
+def test_sobol_is_stratified():
+    points = get_sampler(Samplers.sobol_scrambled, np.random.SeedSequence(0)).sample(None, 0, 1024)
+    histogram, _, _ = np.histogram2d(points[:, 0], points[:, 1], bins=32, range=[[0, 1], [0, 1]])
+    assert np.all(histogram == 1)
+
+
+def test_quasi_monte_carlo_is_more_accurate():
+    circle = Circle(Point('O', 0.5, 0.5), 0.3)
+    for sampler in (Samplers.halton_scrambled, Samplers.sobol_scrambled):
+        result = estimate_area(circle, 2 ** 16, seed=0, sampler=sampler, chunk_size=2 ** 12)
+        assert abs(result.area - circle.get_area()) < result.standard_error
+
+
+def test_only_random_sampler_has_other_dimensions():
+    assert get_sampler(Samplers.random, np.random.SeedSequence(0), dimension=5).sample(None, 0, 10).shape == (10, 5)
+    with pytest.raises(ValueError):
+        get_sampler(Samplers.sobol, np.random.SeedSequence(0), dimension=5)
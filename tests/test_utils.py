@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+from app.figures import Point, Polygon, Circle, Ball
+from app.rendering import draw_result, FigurePool, PackedMask
+from app.utils import (estimate_area, estimate_areas, calculate_area_monte_carlo, get_float32_bias_bound,
+                       PeakMemoryTracker, MemoryBudgetExceeded)
+
+
+def test_estimate_area_is_reproducible_across_workers():
+    polygon = Polygon([Point('A', 0.1, 0.7), Point('B', 0.5, 0.9), Point('C', 0.9, 0.7), Point('D', 0.5, 0.1)])
+    serial = estimate_area(polygon, 100000, chunk_size=4096, seed=7)
+    parallel = estimate_area(polygon, 100000, chunk_size=4096, seed=7, workers=2)
+    assert serial.points_inside == parallel.points_inside
+    assert serial.number_of_points == parallel.number_of_points == 100000
+    assert estimate_area(polygon, 100000, chunk_size=4096, seed=8).points_inside != serial.points_inside
+
+
+def test_adaptive_estimate_is_reproducible_across_workers():
+    polygon = Polygon([Point('A', 0.1, 0.7), Point('B', 0.5, 0.9), Point('C', 0.9, 0.7), Point('D', 0.5, 0.1)])
+    serial = estimate_area(polygon, 10 ** 8, relative_tolerance=0.01, seed=3)
+    parallel = estimate_area(polygon, 10 ** 8, relative_tolerance=0.01, seed=3, workers=3)
+    assert serial.number_of_points == parallel.number_of_points < 10 ** 8
+    assert serial.area == parallel.area
+
+
+def test_bounding_box_sampling_reduces_error_for_small_figures():
+    polygon = Polygon([Point('A', 0.1, 0.1), Point('B', 0.15, 0.1), Point('C', 0.1, 0.15), Point('D', 0.15, 0.15)])
+    unit_square = estimate_area(polygon, 10000, seed=1, domain=(0, 1, 0, 1))
+    bounding_box = estimate_area(polygon, 10000, seed=1)
+    assert bounding_box.area == pytest.approx(0.0025)
+    assert bounding_box.standard_error < unit_square.standard_error
+
+
+def test_memory_budget():
+    polygon = Polygon([Point('A', 0.1, 0.7), Point('B', 0.5, 0.9), Point('C', 0.9, 0.7), Point('D', 0.5, 0.1)])
+    budget = 2 ** 20
+    with PeakMemoryTracker() as memory:
+        result = estimate_area(polygon, 10 ** 6, seed=1, memory_budget=budget)
+    assert result.number_of_points == 10 ** 6
+    assert memory.peak < budget
+    with pytest.raises(MemoryBudgetExceeded):
+        estimate_area(polygon, 10 ** 6, chunk_size=10 ** 6, memory_budget=budget)
+
+
+def test_shared_cloud_reduces_variance_of_area_differences():
+    small, large = Circle(Point('O', 0.5, 0.5), 0.25), Circle(Point('O', 0.5, 0.5), 0.26)
+    domain = (0, 1, 0, 1)
+    shared, independent = [], []
+    for seed in range(20):
+        small_result, large_result = estimate_areas([small, large], 10000, seed=seed, domain=domain)
+        shared.append(large_result.area - small_result.area)
+        independent.append(estimate_area(large, 10000, seed=seed + 100, domain=domain).area -
+                           estimate_area(small, 10000, seed=seed + 200, domain=domain).area)
+    assert np.var(shared) < np.var(independent) / 4
+    assert estimate_areas([small], 10000, seed=1, domain=domain)[0].area == \
+        estimate_area(small, 10000, seed=1, domain=domain).area
+
+
+def test_large_samples_are_drawn_as_one_density_image():
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    coordinates = np.random.default_rng(0).random((100000, 2))
+    inside = circle.contains(coordinates[:, 0], coordinates[:, 1])
+    _, ax = draw_result(circle, coordinates, inside)
+    assert len(ax.images) == 1 and len(ax.collections) == 1
+    _, ax = draw_result(circle, coordinates[:100], inside[:100])
+    assert len(ax.images) == 0 and len(ax.collections) == 3
+
+
+def test_calculate_area_monte_carlo_returns_drawn_figure():
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    assert calculate_area_monte_carlo(circle, 100, seed=1) == calculate_area_monte_carlo(circle, 100, seed=1)
+    area, fig, ax = calculate_area_monte_carlo(circle, 100, draw_final_result=True, seed=1)
+    assert area == calculate_area_monte_carlo(circle, 100, seed=1)
+    assert len(ax.collections) == 3 and sum(len(c.get_offsets()) for c in ax.collections) == 101
+
+
+def test_figure_pool_reuses_clean_figures():
+    pool = FigurePool(max_size=1)
+    with pool.get_figure(xlim=(0, 2), ylim=(0, 3)) as (fig, ax):
+        Circle(Point('O', 0.5, 0.5), 0.25).draw(fig, ax)
+        assert ax.get_xlim() == (0, 2)
+    with pool.get_figure() as (reused_fig, reused_ax):
+        assert reused_fig is fig
+        assert not (reused_ax.lines or reused_ax.collections or reused_ax.texts)
+        assert reused_ax.get_xlim() == (-0.1, 1.1)
+        with pool.get_figure() as (other_fig, _):
+            assert other_fig is not fig
+    assert len(pool) == 1
+
+
+@pytest.mark.parametrize('dimension', [1, 4, 8])
+def test_ball_volume_estimate(dimension):
+    ball = Ball(np.full(dimension, 0.5), 0.5)
+    result = estimate_area(ball, 200000, seed=3, chunk_size=50000)
+    lower, upper = result.get_confidence_interval()
+    assert lower - 1e-12 <= ball.get_volume() <= upper + 1e-12
+    assert result.domain == ball.get_bounding_box() and result.domain_area == 1.0
+    assert estimate_area(ball, 200000, seed=3, chunk_size=50000, workers=2).area == result.area
+
+
+def test_only_2d_balls_are_drawn():
+    area, _, ax = calculate_area_monte_carlo(Ball([0.5, 0.5], 0.25), 100, draw_final_result=True, seed=1)
+    assert area == calculate_area_monte_carlo(Circle(Point('O', 0.5, 0.5), 0.25), 100, seed=1)
+    assert sum(len(c.get_offsets()) for c in ax.collections) == 101
+    ball = Ball(np.zeros(3), 1.0)
+    with pytest.raises(ValueError, match="2-D"):
+        calculate_area_monte_carlo(ball, 10000, draw_final_result=True)
+    with pytest.raises(ValueError, match="2-D"):
+        estimate_area(ball, 10000, filename='ball.png')
+
+
+@pytest.mark.parametrize('figure', [Circle(Point('O', 0.4, 0.6), 0.3), Ball(np.zeros(6), 1.0),
+                                    Ball(np.full(3, 1e5), 0.01),
+                                    Polygon([Point('A', 0.1, 0.1), Point('B', 0.9, 0.2), Point('C', 0.3, 0.8)])])
+def test_float32_bias_is_below_noise(figure):
+    bias, standard_error = get_float32_bias_bound(figure, 10 ** 6)
+    assert bias < 0.01 * standard_error
+    result = estimate_area(figure, 10 ** 5, seed=2, dtype='float32')
+    lower, upper = result.get_confidence_interval()
+    assert lower <= figure.get_area() <= upper and result.to_dict()['dtype'] == 'float32'
+
+
+@pytest.mark.parametrize('figure', [Ball(np.full(3, 1e5), 0.01), Circle(Point('O', 1e5, -1e5), 0.01),
+                                    Polygon([Point('A', 1e4, 1e4), Point('B', 1e4 + 0.8, 1e4 + 0.1),
+                                             Point('C', 1e4 + 0.2, 1e4 + 0.7)])])
+def test_float32_estimates_far_from_the_origin(figure):
+    result = estimate_area(figure, 10 ** 5, seed=2, dtype='float32')
+    lower, upper = result.get_confidence_interval()
+    assert lower <= figure.get_area() <= upper and result.domain == figure.get_bounding_box()
+
+
+def test_packed_mask():
+    masks = np.random.default_rng(0).random((3, 1001)) < 0.3
+    union = PackedMask.pack(masks[0])
+    for mask in masks[1:]:
+        union |= PackedMask.pack(mask)
+    assert union.bits.nbytes == 126
+    assert np.array_equal(union.unpack(), masks.any(axis=0))
+    assert np.array_equal(union.unpack(504, 1001), masks.any(axis=0)[504:])
+    with pytest.raises(ValueError):
+        union |= PackedMask.pack(masks[0][:1000])
+
+
+def test_density_image_of_packed_mask():
+    circle = Circle(Point('O', 0.5, 0.5), 0.25)
+    coordinates = np.random.default_rng(0).random((300001, 2))
+    inside = circle.contains(coordinates[:, 0], coordinates[:, 1])
+    _, ax = draw_result(circle, coordinates, inside)
+    _, packed_ax = draw_result(circle, coordinates, PackedMask.pack(inside))
+    assert np.array_equal(ax.images[0].get_array(), packed_ax.images[0].get_array())
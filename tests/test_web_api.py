@@ -1,7 +1,14 @@
+import json
 import os
+import subprocess
+import sys
+import threading
+import time
 import numpy as np
 from fastapi.testclient import TestClient
-from app.main_v2 import app
+import app.main_v2 as main_v2
+from app.main_v2 import app, area_cache
+from app.rendering import figure_pool
 
 #path = pathlib.PurePath(os.path.abspath(__file__))
 #if path.parent.name == 'tests':
@@ -21,6 +28,12 @@ def test_get_figure_bad():
     assert response.status_code == 404
 
 
+def test_create_points():
+    response = client.post("/create_points", json=[{"name": "A", "x": 0.1, "y": 0.2, "color": "red", "size": 20}])
+    assert response.status_code == 200
+    assert response.content.startswith(b'\x89PNG')
+
+
 def test_circle_good():
     radius = 0.25
     area = np.pi * radius ** 2
@@ -37,8 +50,25 @@ def test_circle_good():
     assert area * 0.8 < response.json()['area'] < area * 1.2
 
 
+def test_circle_outside_unit_square():
+    radius = 0.25
+    area = np.pi * radius ** 2
+    response = client.post("/calculate_area_circle/?number_of_points=5000",
+                           json={
+                               "center": {
+                                   "name": "O",
+                                   "x": 0.2,
+                                   "y": 0.2
+                               },
+                               "radius": radius
+                           })
+    assert response.status_code == 200
+    assert area * 0.9 < response.json()['area'] < area * 1.1
+    assert np.allclose(response.json()['sampling_box'], [-0.05, 0.45, -0.05, 0.45])
+
+
 def test_circle_bad():
-    response = client.post("/calculate_area_circle",
+    response = client.post("/calculate_area_circle?box_left=0.5&box_right=0.2&box_bottom=0&box_top=1",
                            json={
                                "center": {
                                    "name": "O",
@@ -48,3 +78,266 @@ def test_circle_bad():
                                "radius": 0.25
                            })
     assert response.status_code == 400
+
+
+def test_circle_chunked():
+    radius = 0.25
+    area = np.pi * radius ** 2
+    response = client.post("/calculate_area_circle/?number_of_points=5000&chunk_size=64",
+                           json={"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": radius})
+    assert response.status_code == 200
+    assert area * 0.8 < response.json()['area'] < area * 1.2
+
+
+def test_circle_adaptive():
+    radius = 0.25
+    area = np.pi * radius ** 2
+    response = client.post("/calculate_area_circle/?number_of_points=100000000&relative_tolerance=0.02",
+                           json={"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": radius})
+    assert response.status_code == 200
+    result = response.json()
+    lower, upper = result['confidence_interval']
+    assert result['number_of_points'] < 100000000
+    assert (upper - lower) / 2 <= 0.02 * result['area']
+    assert area * 0.9 < result['area'] < area * 1.1
+
+
+def test_poly_from_file():
+    with open("example_requests/example_poly_1.json", "rb") as file:
+        response = client.post("/calculate_area_poly_from_file/?number_of_points=20000",
+                               files={"file": ("example_poly_1.json", file, "application/json")})
+    assert response.status_code == 200
+    assert 0.2 < response.json()['area'] < 0.3
+
+
+def test_server_timing_and_metrics():
+    with open("example_requests/example_poly_1.json", "rb") as file:
+        response = client.post("/calculate_area_poly_from_file/?number_of_points=1000",
+                               files={"file": ("example_poly_1.json", file, "application/json")})
+    phases = [entry.split(';')[0] for entry in response.headers['server-timing'].split(', ')]
+    assert phases == ['parse', 'construction', 'sampling', 'containment', 'monte_carlo', 'total']
+    metrics = client.get("/metrics").text
+    assert 'area_phase_duration_seconds_count{phase="parse"}' in metrics
+    assert 'http_request_duration_seconds_count{endpoint="calculate_area_poly_from_file"}' in metrics
+    assert 'monte_carlo_samples_total' in metrics
+
+
+def test_circle_over_memory_budget():
+    response = client.post("/calculate_area_circle/?number_of_points=1000000000&chunk_size=1000000000",
+                           json={"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25})
+    assert response.status_code == 400
+
+
+def test_circle_engines():
+    radius = 0.25
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": radius}
+    exact = client.post("/calculate_area_circle/?engine=exact", json=circle).json()
+    assert exact['area'] == exact['exact_area'] == np.pi * radius ** 2
+    both = client.post("/calculate_area_circle/?engine=both&number_of_points=10000", json=circle).json()
+    assert both['exact_area'] == exact['area']
+    assert both['error'] == both['area'] - both['exact_area']
+    assert abs(both['error']) < 5 * both['standard_error']
+    url = "/calculate_area_circle/?engine=both&number_of_points=10000&dtype=float32"
+    single = client.post(url, json=circle).json()
+    assert single['dtype'] == 'float32' and single['cached'] is False
+    assert abs(single['error']) < 5 * single['standard_error']
+
+
+def test_ball_volume():
+    ball = {"center": [0.0] * 4, "radius": 1.0}
+    response = client.post("/calculate_volume_ball?engine=both&number_of_points=100000&seed=1", json=ball)
+    assert response.status_code == 200
+    result = response.json()
+    assert result['figure'] == 'ball_4d' and np.isclose(result['exact_area'], np.pi ** 2 / 2)
+    assert abs(result['error']) < 5 * result['standard_error']
+    assert result['sampling_box'] == [-1.0, 1.0] * 4
+    assert client.post("/calculate_volume_ball", json={"center": [0.0] * 21, "radius": 1.0}).status_code == 422
+    assert client.post("/calculate_volume_ball?sampler=sobol", json=ball).status_code == 400
+    huge = {"center": [0.0] * 20, "radius": 1e20}
+    assert client.post("/calculate_volume_ball?engine=exact", json=huge).status_code == 422
+    assert client.post("/calculate_volume_ball", json={"center": [1e20, 0.0], "radius": 1.0}).status_code == 422
+    largest = {"center": [1e6] * 20, "radius": 1e6}
+    response = client.post("/calculate_volume_ball?engine=both&number_of_points=10000&seed=1", json=largest)
+    assert response.status_code == 200 and np.isfinite(response.json()['area'])
+
+
+def test_poly_area_is_cached():
+    with open("example_requests/example_poly_3.json", "rb") as file:
+        content = file.read()
+    url = "/calculate_area_poly_from_bytes/?number_of_points=20000&seed=11"
+    first = client.post(url, files={"file": ("example_poly_3.json", content, "application/json")}).json()
+    second = client.post(url, files={"file": ("example_poly_3.json", content, "application/json")}).json()
+    assert not first['cached'] and second['cached']
+    assert first['area'] == second['area']
+    assert client.get("/cache").json()['hits'] >= 1
+
+
+def test_unseeded_estimates_are_not_cached():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    results = [client.post("/calculate_area_circle?number_of_points=1000", json=circle).json() for _ in range(3)]
+    assert not any(result['cached'] for result in results)
+    assert len({result['seed'] for result in results}) == 3
+
+
+def test_rendered_figure_is_stored_and_revalidated():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    url = "/calculate_area_circle/?number_of_points=1000&seed=5&filename=circle_5.png"
+    response = client.post(url, json=circle)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/png'
+    assert response.headers['content-disposition'] == 'attachment; filename="circle_5.png"'
+    etag = response.headers['etag']
+    assert 'plot' not in client.post(url, json=circle).headers['server-timing']
+    assert client.post(url, json=circle, headers={'If-None-Match': etag}).status_code == 304
+    figure_url = f"/get_figure/{etag.strip(chr(34))}.png"
+    assert client.get(figure_url).content == response.content
+    assert client.get(figure_url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.delete(f"/delete_figure/?filename={etag.strip(chr(34))}.png").status_code == 200
+    assert client.get(figure_url).status_code == 404
+
+
+def test_unseeded_figure_is_keyed_by_resolved_seed():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.2}
+    url = "/calculate_area_circle/?number_of_points=1000&filename=circle.png"
+    first = client.post(url, json=circle)
+    second = client.post(url, json=circle)
+    assert second.headers['seed'] != first.headers['seed']
+    assert second.headers['etag'] != first.headers['etag']
+    assert client.post(url, json=circle, headers={'If-None-Match': second.headers['etag']}).status_code == 200
+
+
+def test_area_batch():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    square = {"name": "square", "vertices": [{"name": "A", "x": 0.1, "y": 0.1}, {"name": "B", "x": 0.6, "y": 0.1},
+                                             {"name": "C", "x": 0.6, "y": 0.6}, {"name": "D", "x": 0.1, "y": 0.6}]}
+    response = client.post("/calculate_area_batch?number_of_points=100000&seed=1&engine=both",
+                           json={"figures": [{"circle": circle}, {"polygon": square}]})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['figure'] for result in results] == ['circle', 'square']
+    assert all(abs(result['relative_error']) < 0.05 for result in results)
+    assert results[0]['sampling_box'] == results[1]['sampling_box'] == [0.1, 0.75, 0.1, 0.75]
+    assert client.post("/calculate_area_batch", json={"figures": []}).status_code == 422
+
+
+def test_area_of_large_polygon():
+    angles = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+    vertices = [{"name": f"p{i}", "x": 0.5 + 0.4 * np.cos(angle), "y": 0.5 + 0.4 * np.sin(angle)}
+                for i, angle in enumerate(angles)]
+    polygon = {"name": "large", "vertices": vertices}
+    response = client.post("/calculate_area_batch?number_of_points=100000&seed=1&engine=both",
+                           json={"figures": [{"polygon": polygon}]})
+    assert response.status_code == 200
+    assert abs(response.json()['results'][0]['relative_error']) < 0.05
+    vertices.append(vertices[0])
+    response = client.post("/calculate_area_batch", json={"figures": [{"polygon": polygon}]})
+    assert response.status_code == 422
+    flower = [{"x": 0.5 + (0.3 + 0.1 * np.cos(5 * angle)) * np.cos(angle),
+               "y": 0.5 + (0.3 + 0.1 * np.cos(5 * angle)) * np.sin(angle)} for angle in angles]
+    response = client.post("/calculate_area_batch?number_of_points=100000&seed=1&engine=both",
+                           json={"figures": [{"polygon": {"vertices": flower, "keep_order": True}}]})
+    assert abs(response.json()['results'][0]['relative_error']) < 0.05
+    crossing = {"vertices": flower[::2] + flower[1::2], "keep_order": True}
+    response = client.post("/calculate_area_batch", json={"figures": [{"polygon": crossing}]})
+    assert response.status_code == 400
+
+
+def test_area_stream():
+    circle = {"circle": {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}}
+    response = client.post("/calculate_area_stream?number_of_points=100000&chunk_size=10000&seed=1", json=circle)
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event['event'] for event in events] == ['progress'] * 10 + ['result']
+    assert [event['number_of_points'] for event in events[:-1]] == list(range(10000, 100001, 10000))
+    assert events[-1]['area'] == events[-2]['area']
+    response = client.post("/calculate_area_stream?format=sse&engine=exact", json=circle)
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert response.text.startswith('event: result\ndata: ')
+
+
+def test_area_job():
+    response = client.post("/jobs?number_of_points=10000&seed=1",
+                           json={"circle": {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}})
+    assert response.status_code == 202
+    job_id = response.json()['id']
+    for _ in range(500):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job['status'] == 'finished':
+            break
+        time.sleep(0.01)
+    assert job['progress'] == 1.0
+    assert abs(job['result']['area'] - np.pi * 0.25 ** 2) < 0.01
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.post("/jobs", json={}).status_code == 422
+
+
+def test_cancelled_job_does_not_fail_identical_request():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    query = "number_of_points=20000000&chunk_size=100000&seed=12345"
+    job_id = client.post(f"/jobs?{query}", json={"circle": circle}).json()['id']
+    while client.get(f"/jobs/{job_id}").json()['progress'] == 0:
+        time.sleep(0.01)
+    deduplicated = area_cache.get_stats()['deduplicated']
+    responses = []
+    waiter = threading.Thread(target=lambda: responses.append(
+        client.post(f"/calculate_area_circle?{query}", json=circle)))
+    waiter.start()
+    while area_cache.get_stats()['deduplicated'] == deduplicated:
+        time.sleep(0.01)
+    client.delete(f"/jobs/{job_id}")
+    waiter.join()
+    for _ in range(500):
+        if client.get(f"/jobs/{job_id}").json()['status'] == 'cancelled':
+            break
+        time.sleep(0.01)
+    assert client.get(f"/jobs/{job_id}").json()['status'] == 'cancelled'
+    assert responses[0].status_code == 200
+    assert abs(responses[0].json()['area'] - np.pi * 0.25 ** 2) < 0.001
+
+
+def test_deduplicated_job_reports_progress_and_can_be_cancelled():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    query = "number_of_points=30000000&chunk_size=100000&seed=54321"
+    first_id = client.post(f"/jobs?{query}", json={"circle": circle}).json()['id']
+    while client.get(f"/jobs/{first_id}").json()['progress'] == 0:
+        time.sleep(0.01)
+    second_id = client.post(f"/jobs?{query}", json={"circle": circle}).json()['id']
+    for _ in range(500):
+        if client.get(f"/jobs/{second_id}").json()['progress'] > 0:
+            break
+        time.sleep(0.01)
+    assert client.get(f"/jobs/{second_id}").json()['progress'] > 0
+    client.delete(f"/jobs/{second_id}")
+    for _ in range(100):
+        if client.get(f"/jobs/{second_id}").json()['status'] == 'cancelled':
+            break
+        time.sleep(0.01)
+    assert client.get(f"/jobs/{second_id}").json()['status'] == 'cancelled'
+    assert client.get(f"/jobs/{first_id}").json()['status'] == 'running'
+    client.delete(f"/jobs/{first_id}")
+
+
+def test_deduplicated_stream_reports_progress():
+    circle = {"center": {"name": "O", "x": 0.5, "y": 0.5}, "radius": 0.25}
+    query = "number_of_points=10000000&chunk_size=100000&seed=2468"
+    job_id = client.post(f"/jobs?{query}", json={"circle": circle}).json()['id']
+    while client.get(f"/jobs/{job_id}").json()['progress'] == 0:
+        time.sleep(0.01)
+    response = client.post(f"/calculate_area_stream?{query}", json={"circle": circle})
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[-1]['event'] == 'result' and events[-1]['cached']
+    assert any(event['event'] == 'progress' for event in events[:-1])
+
+
+def test_app_import_does_not_load_matplotlib():
+    script = "import sys, app.main_v2; print('matplotlib' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_warm_up_on_startup(monkeypatch):
+    monkeypatch.setattr(main_v2, 'WARM_UP', True)
+    with figure_pool._lock:
+        figure_pool._figures.clear()
+    with TestClient(app):
+        assert len(figure_pool._figures) == 1